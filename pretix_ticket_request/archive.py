@@ -0,0 +1,76 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils.timezone import now
+
+from .caching import invalidate_redeemed_count
+from .models import ArchiveChunk, Attendee, FreeTextAnswer, TicketRequest, delete_rows
+from .reporting import invalidate_report
+
+TICKET_REQUEST_FIELDS = (
+    'id', 'name', 'email', 'status', 'priority', 'data', 'voucher__code',
+    'created_at', 'updated_at', 'approved_at', 'redeemed_at',
+)
+ATTENDEE_FIELDS = ('id', 'email', 'verified', 'profile', 'created_at', 'updated_at')
+
+
+class EventArchiver:
+    """
+    Move the ticket requests and attendees of a finished event into
+    compressed ``ArchiveChunk`` rows, so the live tables and their indexes
+    only hold events that are still running.
+    """
+    CHUNK_SIZE = 1000
+
+    def __init__(self, *args, **kwargs):
+        self.event = kwargs.pop('event')
+
+        super().__init__(*args, **kwargs)
+
+    def is_due(self):
+        days = self.event.settings.ticket_request_archive_after_days
+        if not days:
+            return False
+        end = self.event.date_to or self.event.date_from
+        return end < now() - timedelta(days=days)
+
+    def run(self):
+        ticket_requests = self.archive(
+            ArchiveChunk.KIND_TICKET_REQUEST, TicketRequest, TICKET_REQUEST_FIELDS, 'ticket_request'
+        )
+        attendees = self.archive(ArchiveChunk.KIND_ATTENDEE, Attendee, ATTENDEE_FIELDS, 'attendee')
+        if ticket_requests or attendees:
+            self.event.log_action('pretix.ticket_request.archived', data={
+                'ticket_requests': ticket_requests,
+                'attendees': attendees,
+            })
+            invalidate_report(self.event)
+            invalidate_redeemed_count(self.event)
+        return ticket_requests, attendees
+
+    def archive(self, kind, model, fields, owner):
+        qs = model.objects.filter(event=self.event).order_by('pk')
+        count = 0
+        while True:
+            with transaction.atomic():
+                pks = list(qs.select_for_update().values_list('pk', flat=True)[:self.CHUNK_SIZE])
+                if not pks:
+                    return count
+
+                free_text = defaultdict(dict)
+                answers = FreeTextAnswer.objects.filter(**{owner + '_id__in': pks})
+                for owner_id, field, value in answers.values_list(owner + '_id', 'field', 'value'):
+                    free_text[owner_id][field] = value
+
+                records = list(model.objects.filter(pk__in=pks).order_by('pk').values(*fields))
+                for record in records:
+                    record['free_text'] = free_text[record['id']]
+                ArchiveChunk.pack(self.event, kind, records).save()
+
+                answers.delete()
+                # The rows were just copied into the archive chunk, so there
+                # are no cascades to collect and no per-row delete signals
+                # to send.
+                delete_rows(model, pks)
+                count += len(pks)
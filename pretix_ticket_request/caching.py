@@ -0,0 +1,69 @@
+import uuid
+
+from django.core.cache import cache
+from django.utils.translation import get_language
+
+SETTINGS_VERSION_KEY = 'pretix_ticket_request_settings_version'
+NAV_URLS_KEY = 'pretix_ticket_request_nav_urls_{organizer}_{event}'
+FRONT_PAGE_KEY = 'pretix_ticket_request_front_page_{version}_{locale}'
+REDEEMED_COUNT_KEY = 'pretix_ticket_request_redeemed_count_{event}'
+FRAGMENT_TTL = 3600
+# The redeemed counter is recounted at least this often, so a missed order
+# signal does not leave it wrong for good.
+REDEEMED_COUNT_TTL = 3600
+# How long browsers and shared caches may reuse the public request page.
+REQUEST_PAGE_MAX_AGE = 60
+
+
+def settings_version(event):
+    """
+    Return a token that changes whenever the plugin settings of ``event``
+    are saved. Cached fragments include it in their key, so saving the
+    settings invalidates all of them at once without enumerating locales.
+    """
+    cache = event.get_cache()
+    version = cache.get(SETTINGS_VERSION_KEY)
+    if version is None:
+        version = bump_settings_version(event)
+    return version
+
+
+def bump_settings_version(event):
+    version = uuid.uuid4().hex
+    event.get_cache().set(SETTINGS_VERSION_KEY, version, None)
+    return version
+
+
+def front_page_key(event):
+    return FRONT_PAGE_KEY.format(version=settings_version(event), locale=get_language())
+
+
+def nav_urls_key(event):
+    return NAV_URLS_KEY.format(organizer=event.organizer.slug, event=event.slug)
+
+
+def redeemed_count(event):
+    """
+    Number of ticket requests of ``event`` whose voucher has been redeemed.
+    The counter lives in the shared cache and is incremented by the order
+    signal receivers; it is recounted from the database when missing, at the
+    latest after ``REDEEMED_COUNT_TTL`` seconds.
+    """
+    key = REDEEMED_COUNT_KEY.format(event=event.pk)
+    count = cache.get(key)
+    if count is None:
+        count = event.ticket_requests.filter(redeemed_at__isnull=False).count()
+        cache.add(key, count, REDEEMED_COUNT_TTL)
+    return count
+
+
+def increment_redeemed_count(event, delta):
+    try:
+        cache.incr(REDEEMED_COUNT_KEY.format(event=event.pk), delta)
+    except ValueError:
+        # Not counted yet, the next read recounts from the database.
+        pass
+
+
+def invalidate_redeemed_count(event):
+    cache.delete(REDEEMED_COUNT_KEY.format(event=event.pk))
@@ -0,0 +1,33 @@
+from collections import OrderedDict
+
+from django import forms
+from django.utils.translation import ugettext_lazy as _
+from pretix.base.exporter import ListExporter
+
+from .reporting import CROSSTABS, DIMENSIONS, crosstab_header, crosstab_rows, get_report
+from .routing import read_database
+
+
+class DemographicsExporter(ListExporter):
+    identifier = 'pretix_ticket_request_demographics'
+    verbose_name = _('Ticket requests: demographic breakdown')
+
+    @property
+    def additional_form_fields(self):
+        return OrderedDict((
+            ('crosstab', forms.ChoiceField(
+                label=_('Breakdown'),
+                choices=[
+                    (name, ' × '.join(str(DIMENSIONS[d][0]) for d in dims))
+                    for name, dims in CROSSTABS.items()
+                ],
+            )),
+        ))
+
+    def iterate_list(self, form_data):
+        name = form_data.get('crosstab') or next(iter(CROSSTABS))
+        yield crosstab_header(name)
+        yield from crosstab_rows(get_report(self.event, using=read_database()), name)
+
+    def get_filename(self):
+        return '{}_demographics'.format(self.event.slug)
@@ -1,10 +1,43 @@
+from datetime import datetime, time, timedelta
+
 from django import forms
+from django.db import connections
+from django.db.models import Q
+from django.utils.timezone import make_aware
+from pretix.base.forms.widgets import DatePickerWidget
 from pretix.control.forms.filter import FilterForm
 from pretix.base.models import Organizer
 from pretix.control.forms.widgets import Select2
 from django.urls import reverse, reverse_lazy
 from django.utils.translation import pgettext_lazy, ugettext_lazy as _
-from .models import TicketRequest
+from .forms import TicketRequestBaseForm, country_choices
+from .models import FreeTextAnswer, TicketRequest
+
+
+def filter_json_contains(qs, field, value):
+    """
+    Restrict ``qs`` to rows whose JSON ``field`` contains all key/value pairs
+    of ``value``. On PostgreSQL this is a ``@>`` containment query that can use
+    the GIN index on the column, MySQL uses ``JSON_CONTAINS``. Other databases
+    store the JSON as text, so we fall back to matching the documents in Python
+    and narrowing the queryset down by primary key.
+    """
+    if connections[qs.db].vendor in ('postgresql', 'mysql'):
+        return qs.filter(**{'{}__contains'.format(field): value})
+
+    pks = [
+        pk for pk, document in qs.values_list('pk', field).iterator()
+        if _json_contains(document or {}, value)
+    ]
+    return qs.filter(pk__in=pks)
+
+
+def _json_contains(document, value):
+    if isinstance(value, dict):
+        return isinstance(document, dict) and all(
+            k in document and _json_contains(document[k], v) for k, v in value.items()
+        )
+    return document == value
 
 
 class TicketRequestSearchFilterForm(FilterForm):
@@ -17,16 +50,28 @@ class TicketRequestSearchFilterForm(FilterForm):
     query = forms.CharField(
         label=_('Search for...'),
         widget=forms.TextInput(attrs={
-            'placeholder': _('Event name'),
+            'placeholder': _('Email or PGP fingerprint'),
             'autofocus': 'autofocus'
         }),
         required=False
     )
 
+    redeemed = forms.ChoiceField(
+        label=_('Voucher redeemed'),
+        choices=(
+            ('', _('All')),
+            ('True', _('Redeemed')),
+            ('False', _('Not redeemed')),
+        ),
+        required=False
+    )
+
     def __init__(self, *args, **kwargs):
         request = kwargs.pop('request')
         super().__init__(*args, **kwargs)
 
+        self.fields['status'].choices = [('', _('All'))] + list(TicketRequest.STATUS_CHOICE)
+
     def filter_qs(self, qs):
         fdata = self.cleaned_data
         qs = super().filter_qs(qs)
@@ -34,4 +79,108 @@ class TicketRequestSearchFilterForm(FilterForm):
         if fdata.get('organizer'):
             qs = qs.filter(event__organizer=fdata.get('organizer'))
 
+        if fdata.get('status'):
+            qs = qs.filter(status=fdata.get('status'))
+
+        if fdata.get('query'):
+            query = fdata.get('query').strip()
+            fingerprint = FreeTextAnswer.objects.filter(
+                field='pgp_key',
+                search_key=query.replace(' ', '').upper(),
+                ticket_request__isnull=False,
+            )
+            qs = qs.filter(Q(email__icontains=query) | Q(pk__in=fingerprint.values('ticket_request_id')))
+
+        if fdata.get('redeemed') == 'True':
+            qs = qs.filter(redeemed_at__isnull=False)
+        elif fdata.get('redeemed') == 'False':
+            qs = qs.filter(status=TicketRequest.STATUS_APPROVED, redeemed_at__isnull=True)
+
+        return qs
+
+
+class AttendeeFilterForm(FilterForm):
+    YES_NO_CHOICES = (
+        ('', _('All')),
+        ('True', _('Yes')),
+        ('False', _('No')),
+    )
+    profile_fields = (
+        'country',
+        'gender',
+        'subscribe_mailing_list',
+        'receive_mattermost_invite',
+    )
+
+    country = forms.ChoiceField(
+        label=_('Country'),
+        required=False,
+    )
+
+    gender = forms.ChoiceField(
+        label=_('Gender'),
+        required=False,
+    )
+
+    subscribe_mailing_list = forms.ChoiceField(
+        label=_('Mailing list'),
+        choices=YES_NO_CHOICES,
+        required=False,
+    )
+
+    receive_mattermost_invite = forms.ChoiceField(
+        label=_('Mattermost invite'),
+        choices=YES_NO_CHOICES,
+        required=False,
+    )
+
+    verified = forms.ChoiceField(
+        label=_('Verified'),
+        choices=YES_NO_CHOICES,
+        required=False,
+    )
+
+    date_from = forms.DateField(
+        label=_('Registered from'),
+        widget=DatePickerWidget(),
+        required=False,
+    )
+
+    date_until = forms.DateField(
+        label=_('Registered until'),
+        widget=DatePickerWidget(),
+        required=False,
+    )
+
+    def __init__(self, *args, **kwargs):
+        self.request = kwargs.pop('request')
+        super().__init__(*args, **kwargs)
+
+        self.fields['country'].choices = [('', _('All countries'))] + list(country_choices())
+        self.fields['gender'].choices = [('', _('All genders'))] + list(
+            TicketRequestBaseForm.base_fields['gender'].choices
+        )
+
+    def filter_qs(self, qs):
+        fdata = self.cleaned_data
+        qs = super().filter_qs(qs)
+        tz = self.request.event.timezone
+
+        if fdata.get('verified'):
+            qs = qs.filter(verified=fdata.get('verified') == 'True')
+
+        if fdata.get('date_from'):
+            qs = qs.filter(created_at__gte=make_aware(datetime.combine(fdata.get('date_from'), time.min), tz))
+
+        if fdata.get('date_until'):
+            qs = qs.filter(created_at__lt=make_aware(
+                datetime.combine(fdata.get('date_until') + timedelta(days=1), time.min), tz
+            ))
+
+        # Profile answers are stored as submitted by the profile form, so the
+        # yes/no questions hold the strings 'True' and 'False'.
+        profile = {k: fdata.get(k) for k in self.profile_fields if fdata.get(k)}
+        if profile:
+            qs = filter_json_contains(qs, 'profile', profile)
+
         return qs
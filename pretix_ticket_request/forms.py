@@ -1,22 +1,40 @@
 import json
+from functools import lru_cache
 
 from django import forms
 from django.db.models.query import QuerySet
 from django.utils.translation import (
-    pgettext_lazy, ugettext_lazy as _, ugettext_noop,
+    get_language, override, pgettext_lazy, ugettext_lazy as _,
 )
 from django_countries import Countries
 from i18nfield.forms import (
     I18nForm, I18nFormField, I18nTextarea, I18nTextInput,
 )
-from i18nfield.strings import LazyI18nString
 from django.core.exceptions import ValidationError
 from pretix.base.validators import EmailBanlistValidator
 from pretix.base.forms import SettingsForm
 from pretix.base.models import Quota
-from pretix.base.services.mail import mail
-from pretix.base.i18n import language
-from .models import TicketRequest, Attendee
+from .caching import bump_settings_version
+from .models import (
+    Attendee, FreeTextAnswer, FunnelBucket, PendingSubmission, TicketRequest, update_json_fields,
+)
+from .pgp import summarize_pgp_key
+from .reporting import invalidate_report
+from .services import RequestConfirmationMailer
+
+
+@lru_cache(maxsize=None)
+def _country_choices_for(locale):
+    with override(locale):
+        return tuple((code, str(name)) for code, name in Countries())
+
+
+def country_choices():
+    """
+    Country choices are translated and sorted once per locale instead of
+    on every form instantiation.
+    """
+    return _country_choices_for(get_language())
 
 
 class TicketRequestsSettingsForm(I18nForm, SettingsForm):
@@ -28,6 +46,75 @@ class TicketRequestsSettingsForm(I18nForm, SettingsForm):
         help_text="Voucher will be created for any ticket under this quota"
     )
 
+    ticket_request_auto_approve = forms.BooleanField(
+        label=_('Approve requests automatically'),
+        required=False,
+        help_text=_('Pending requests are approved in the background whenever the ticket quota has capacity.'),
+    )
+
+    ticket_request_auto_approve_order = forms.ChoiceField(
+        label=_('Automatic approval order'),
+        choices=(
+            ('fifo', _('First come, first served')),
+            ('priority', _('Highest priority first')),
+        ),
+        required=False,
+    )
+
+    ticket_request_auto_approve_max_per_run = forms.IntegerField(
+        label=_('Maximum automatic approvals per run'),
+        min_value=1,
+        required=False,
+    )
+
+    ticket_request_pending_expiry_days = forms.IntegerField(
+        label=_('Expire pending requests after'),
+        help_text=_('Number of days after which pending requests are rejected automatically. Set to 0 to disable.'),
+        min_value=0,
+        required=False,
+    )
+
+    ticket_request_voucher_revoke_days = forms.IntegerField(
+        label=_('Revoke unredeemed vouchers after'),
+        help_text=_('Number of days after approval after which unused vouchers are revoked and their tickets are '
+                    'returned to the quota. Set to 0 to disable.'),
+        min_value=0,
+        required=False,
+    )
+
+    ticket_request_buffered_ingestion = forms.BooleanField(
+        label=_('Buffer incoming requests'),
+        required=False,
+        help_text=_('Submitted requests are queued and saved in batches in the background, which handles large '
+                    'bursts of submissions. Confirmation emails are sent once a request has been saved.'),
+    )
+
+    ticket_request_archive_after_days = forms.IntegerField(
+        label=_('Archive requests and attendees after'),
+        help_text=_('Number of days after the end of the event after which its ticket requests and attendees are '
+                    'moved to the archive, where they can still be viewed but no longer changed. Set to 0 to '
+                    'disable.'),
+        min_value=0,
+        required=False,
+    )
+
+    ticket_request_retention_days = forms.IntegerField(
+        label=_('Remove personal data after'),
+        help_text=_('Number of days after the end of the event after which the personal data of applicants and '
+                    'attendees is removed. Set to 0 to disable.'),
+        min_value=0,
+        required=False,
+    )
+
+    ticket_request_retention_mode = forms.ChoiceField(
+        label=_('Personal data removal'),
+        choices=(
+            ('anonymize', _('Anonymize requests and attendees')),
+            ('delete', _('Delete requests and attendees, anonymize requests with a voucher')),
+        ),
+        required=False,
+    )
+
     def __init__(self, *args, **kwargs):
         self.event = kwargs.pop('event')
         super().__init__(*args, **kwargs)
@@ -37,6 +124,7 @@ class TicketRequestsSettingsForm(I18nForm, SettingsForm):
 
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
+        bump_settings_version(self.event)
 
 
 class TicketRequestBaseForm(forms.ModelForm):
@@ -94,7 +182,7 @@ class TicketRequestBaseForm(forms.ModelForm):
 
     country = forms.ChoiceField(
         label=_("Country of Origin"),
-        choices=Countries()
+        choices=country_choices
     )
 
     is_refugee = forms.TypedChoiceField(
@@ -180,6 +268,75 @@ class TicketRequestBaseForm(forms.ModelForm):
         widget=forms.RadioSelect
     )
 
+    # Long answers stored in FreeTextAnswer instead of the JSON document,
+    # mapped to the function computing the summary kept in the document.
+    free_text_fields = {
+        'pgp_key': summarize_pgp_key,
+    }
+
+    def _load_free_text_initial(self, **owner):
+        if not all(o is not None and o.pk for o in owner.values()):
+            return
+        self.initial = dict(self.initial, **dict(
+            FreeTextAnswer.objects.filter(field__in=self.free_text_fields, **owner).values_list('field', 'value')
+        ))
+
+    def _free_text_summaries(self):
+        return {
+            '{}_summary'.format(field): summarize(self.cleaned_data[field])
+            for field, summarize in self.free_text_fields.items()
+            if self.cleaned_data.get(field)
+        }
+
+    def _save_free_text(self, **owner):
+        """
+        Store changed free-text answers of ``owner`` and return the changes to
+        their summaries in the JSON document.
+        """
+        stored = dict(
+            FreeTextAnswer.objects.filter(field__in=self.free_text_fields, **owner).values_list('field', 'value')
+        )
+        changes = {}
+        for field, summarize in self.free_text_fields.items():
+            value = self.cleaned_data.get(field) or ''
+            if stored.get(field, '') == value:
+                continue
+            if value:
+                FreeTextAnswer.objects.update_or_create(field=field, defaults={'value': value}, **owner)
+            else:
+                FreeTextAnswer.objects.filter(field=field, **owner).delete()
+            changes['{}_summary'.format(field)] = summarize(value) if value else None
+        return changes
+
+    def _load_json_initial(self, meta_json):
+        self.initial = dict(self.initial, **{
+            field: meta_json[field]
+            for field in self.Meta.json_fields
+            if meta_json.get(field)
+        })
+
+    def _json_changes(self, document):
+        """
+        Return the answers in ``Meta.json_fields`` that differ from ``document``.
+        Blank answers to questions that were never answered do not count.
+        """
+        changes = {}
+        for field in self.Meta.json_fields:
+            value = self.cleaned_data[field]
+            if field in document:
+                if document[field] != value:
+                    changes[field] = value
+            elif value not in self.fields[field].empty_values:
+                changes[field] = value
+        return changes
+
+    def _model_changes(self):
+        return {
+            field: self.cleaned_data[field]
+            for field in self.Meta.fields
+            if field in self.changed_data
+        }
+
     def clean_follow_coc(self):
         follow_coc = self.cleaned_data.get('follow_coc')
 
@@ -197,7 +354,6 @@ class TicketRequestBaseForm(forms.ModelForm):
         json_fields = (
             'public_name',
             'years_attended_iff',
-            'pgp_key',
             'gender',
             'country',
             'is_refugee',
@@ -217,18 +373,26 @@ class TicketRequestDetailForm(TicketRequestBaseForm):
         super().__init__(*args, **kwargs)
 
         if self.instance:
-            meta_json = self.instance.data
-            for field in self.Meta.json_fields:
-                if meta_json.get(field):
-                    self.fields[field].initial = meta_json.get(field)
+            self._load_json_initial(self.instance.data)
+            self._load_free_text_initial(ticket_request=self.instance)
 
     def save(self, commit=True):
-        meta_json = self.instance.data
-        for field in self.Meta.json_fields:
-            meta_json[field] = self.cleaned_data[field]
-        self.instance.data = meta_json
+        changes = self._json_changes(self.instance.data)
+        if not commit:
+            self.instance.data.update(changes)
+            return super().save(commit=False)
 
-        return super().save(commit=commit)
+        changes.update(self._save_free_text(ticket_request=self.instance))
+        if update_json_fields(self.instance, 'data', changes, **self._model_changes()):
+            invalidate_report(self.instance.event)
+        return self.instance
+
+    class Meta(TicketRequestBaseForm.Meta):
+        fields = (
+            'name',
+            'email',
+            'priority',
+        )
 
 
 class TicketRequestForm(TicketRequestBaseForm):
@@ -238,57 +402,58 @@ class TicketRequestForm(TicketRequestBaseForm):
         super().__init__(*args, **kwargs)
 
         if self.instance:
-            meta_json = self.instance.data
-            for field in self.Meta.json_fields:
-                if meta_json.get(field):
-                    self.fields[field].initial = meta_json.get(field)
+            self._load_json_initial(self.instance.data)
 
     def save(self, commit=True):
         meta_json = self.instance.data
         for field in self.Meta.json_fields:
             meta_json[field] = self.cleaned_data[field]
+        meta_json.update(self._free_text_summaries())
         self.instance.data = meta_json
 
         saved = super().save(commit=commit)
 
+        if saved and self.instance.pk:
+            FreeTextAnswer.objects.bulk_create([
+                FreeTextAnswer(
+                    ticket_request=self.instance,
+                    field=field,
+                    value=self.cleaned_data[field],
+                    search_key=FreeTextAnswer.search_key_for(field, self.cleaned_data[field]),
+                )
+                for field in self.free_text_fields
+                if self.cleaned_data.get(field)
+            ])
+
         if saved:
             event = self.event
             email = self.instance.email
             name = self.instance.name
 
-            self._send_confirmation_email(email=email, name=name, event=event)
-
-        return saved
-
-    def _send_confirmation_email(self, *args, **kwargs):
-        locale = 'en'
-        email = kwargs.pop('email')
-        name = kwargs.pop('name')
-        event = kwargs.pop('event')
+            FunnelBucket.bump(event, 'requested')
 
-        with language(locale):
-            email_content = LazyI18nString.from_gettext(ugettext_noop("""Dear {name} ,
+            RequestConfirmationMailer(event=event, email=email, name=name).send()
 
-Thank you for applying for an IFF Ticket. We are currently reviewing ticket requests, and as space becomes available, we will be issuing tickets.
-
-If you have any questions, please email team@internetfreedomfestival.org
-
-Best regards,
-Your {event} team"""))
-
-            email_context = {
-                'event': event,
-                'name': name
-            }
+        return saved
 
-            mail(
-                email,
-                _('Your {event} ticket request').format(event=str(event)),
-                email_content,
-                email_context,
-                event,
-                locale=locale
-            )
+    def enqueue(self):
+        """
+        Stage the validated submission for ``SubmissionDrainer`` instead of
+        creating the ticket request right away.
+        """
+        data = {field: self.cleaned_data[field] for field in self.Meta.json_fields}
+        data.update(self._free_text_summaries())
+        return PendingSubmission.objects.create(
+            event=self.event,
+            name=self.cleaned_data['name'],
+            email=self.cleaned_data['email'],
+            data=data,
+            free_text={
+                field: self.cleaned_data[field]
+                for field in self.free_text_fields
+                if self.cleaned_data.get(field)
+            },
+        )
 
 
 class YourAccountStepForm(forms.Form):
@@ -344,10 +509,7 @@ class AttendeeBaseForm(TicketRequestBaseForm):
         super().__init__(*args, **kwargs)
 
         if self.instance:
-            meta_json = self.instance.profile
-            for field in self.Meta.json_fields:
-                if meta_json.get(field):
-                    self.fields[field].initial = meta_json.get(field)
+            self._load_json_initial(self.instance.profile)
 
     class Meta:
         model = Attendee
@@ -356,7 +518,6 @@ class AttendeeBaseForm(TicketRequestBaseForm):
             'name',
             'public_name',
             'years_attended_iff',
-            'pgp_key',
             'gender',
             'country',
             'is_refugee',
@@ -377,13 +538,14 @@ class AttendeeProfileForm(AttendeeBaseForm):
 
         super().__init__(*args, **kwargs)
 
-    def save(self, commit=True):
-        meta_json = self.attendee.profile
-        for field in self.Meta.json_fields:
-            meta_json[field] = self.cleaned_data[field]
-        self.attendee.profile = meta_json
+        self._load_free_text_initial(attendee=self.attendee)
 
-        return self.attendee.save()
+    def save(self, commit=True):
+        changes = self._json_changes(self.attendee.profile)
+        changes.update(self._save_free_text(attendee=self.attendee))
+        if update_json_fields(self.attendee, 'profile', changes):
+            invalidate_report(self.attendee.event)
+        return self.attendee
 
 
 class AttendeeDetailForm(AttendeeBaseForm):
@@ -392,6 +554,7 @@ class AttendeeDetailForm(AttendeeBaseForm):
 
         if self.instance:
             self.fields['email'].widget.attrs['readonly'] = True
+            self._load_free_text_initial(attendee=self.instance)
 
     def clean_email(self):
         if self.instance:
@@ -400,12 +563,15 @@ class AttendeeDetailForm(AttendeeBaseForm):
             return self.cleaned_data['email']
 
     def save(self, commit=True):
-        meta_json = self.instance.profile
-        for field in self.Meta.json_fields:
-            meta_json[field] = self.cleaned_data[field]
-        self.instance.profile = meta_json
+        changes = self._json_changes(self.instance.profile)
+        if not commit:
+            self.instance.profile.update(changes)
+            return super().save(commit=False)
 
-        return super().save(commit=commit)
+        changes.update(self._save_free_text(attendee=self.instance))
+        if update_json_fields(self.instance, 'profile', changes, **self._model_changes()):
+            invalidate_report(self.instance.event)
+        return self.instance
 
     class Meta:
         model = Attendee
@@ -416,7 +582,6 @@ class AttendeeDetailForm(AttendeeBaseForm):
             'name',
             'public_name',
             'years_attended_iff',
-            'pgp_key',
             'gender',
             'country',
             'is_refugee',
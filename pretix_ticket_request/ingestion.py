@@ -0,0 +1,85 @@
+from django.db import transaction
+
+from .models import (
+    FreeTextAnswer, FunnelBucket, PendingSubmission, TicketRequest, insert_rows,
+)
+from .reporting import invalidate_report
+from .services import RequestConfirmationMailer
+
+
+class SubmissionDrainer:
+    """
+    Turn staged ``PendingSubmission`` rows into ticket requests in batches.
+
+    Every batch is a single transaction. Submissions for an email that already
+    has a ticket request, or that appears earlier in the same batch, are
+    dropped, including requests for the same email that are created
+    concurrently. Confirmation mails go out once the batch has
+    been committed.
+    """
+    BATCH_SIZE = 500
+
+    def __init__(self, *args, **kwargs):
+        self.event = kwargs.pop('event')
+
+        super().__init__(*args, **kwargs)
+
+    def run(self):
+        created = 0
+        while True:
+            count = self._drain_batch()
+            if count is None:
+                break
+            created += count
+
+        if created:
+            invalidate_report(self.event)
+        return created
+
+    def _drain_batch(self):
+        with transaction.atomic():
+            # Skipping locked rows lets several workers drain side by side.
+            batch = list(
+                PendingSubmission.objects.filter(event=self.event)
+                .order_by('pk').select_for_update(skip_locked=True)[:self.BATCH_SIZE]
+            )
+            if not batch:
+                return None
+
+            # Emails are unique across all events.
+            emails = {submission.email for submission in batch}
+            seen = set(TicketRequest.objects.filter(email__in=emails).values_list('email', flat=True))
+            candidates = {}
+            for submission in batch:
+                if submission.email not in seen:
+                    seen.add(submission.email)
+                    candidates[submission.email] = submission
+
+            # A direct submission or another drainer may insert the same email
+            # after the check above. Those rows are skipped instead of failing
+            # the whole batch on the unique constraint, and only the rows this
+            # batch actually inserted are accepted.
+            ids = insert_rows(TicketRequest, [
+                TicketRequest(event=self.event, name=submission.name, email=submission.email, data=submission.data)
+                for submission in candidates.values()
+            ], 'email')
+            accepted = [submission for email, submission in candidates.items() if email in ids]
+
+            FreeTextAnswer.objects.bulk_create([
+                FreeTextAnswer(
+                    ticket_request_id=ids[submission.email],
+                    field=field,
+                    value=value,
+                    search_key=FreeTextAnswer.search_key_for(field, value),
+                )
+                for submission in accepted
+                for field, value in submission.free_text.items()
+            ])
+            PendingSubmission.objects.filter(pk__in=[submission.pk for submission in batch]).delete()
+
+            if accepted:
+                FunnelBucket.bump(self.event, 'requested', len(accepted))
+            for submission in accepted:
+                mailer = RequestConfirmationMailer(event=self.event, email=submission.email, name=submission.name)
+                transaction.on_commit(mailer.send)
+            return len(accepted)
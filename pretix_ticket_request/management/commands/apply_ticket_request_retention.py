@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django_scopes import scopes_disabled
+from pretix.base.models import Event
+
+from pretix_ticket_request.retention import RetentionEngine
+
+
+class Command(BaseCommand):
+    help = "Anonymize or delete personal data of events whose retention period has passed"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--event', type=int, action='append', dest='events',
+                            help='Only process the event with this ID. Can be given multiple times.')
+
+    def handle(self, *args, **options):
+        with scopes_disabled():
+            events = Event.objects.filter(plugins__contains='pretix_ticket_request')
+            if options['events']:
+                events = events.filter(pk__in=options['events'])
+
+            for event in events:
+                engine = RetentionEngine(event=event)
+                if not engine.is_due():
+                    continue
+                # Unlike the periodic task, work through everything at once.
+                counts = engine.run(max_batches=None)
+                self.stdout.write('{}: {} ticket requests, {} attendees, {} archive chunks'.format(
+                    event.slug, counts['ticket_request'], counts['attendee'], counts['archive']
+                ))
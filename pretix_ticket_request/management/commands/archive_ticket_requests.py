@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django_scopes import scopes_disabled
+from pretix.base.models import Event
+
+from pretix_ticket_request.archive import EventArchiver
+
+
+class Command(BaseCommand):
+    help = "Move ticket requests and attendees of finished events into the archive"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--event', type=int, action='append', dest='events',
+                            help='Only archive the event with this ID. Can be given multiple times.')
+        parser.add_argument('--force', action='store_true',
+                            help='Archive the given events even if they are not due according to their settings.')
+
+    def handle(self, *args, **options):
+        with scopes_disabled():
+            events = Event.objects.filter(plugins__contains='pretix_ticket_request')
+            if options['events']:
+                events = events.filter(pk__in=options['events'])
+
+            for event in events:
+                archiver = EventArchiver(event=event)
+                if not (options['force'] and options['events']) and not archiver.is_due():
+                    continue
+                ticket_requests, attendees = archiver.run()
+                self.stdout.write('{}: {} ticket requests, {} attendees'.format(event.slug, ticket_requests, attendees))
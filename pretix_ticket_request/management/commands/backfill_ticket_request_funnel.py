@@ -0,0 +1,60 @@
+from collections import Counter, defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django_scopes import scopes_disabled
+from pretix.base.models import Event
+
+from pretix_ticket_request.models import FunnelBucket
+
+CHUNK_SIZE = 2000
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily ticket request funnel from existing ticket requests and attendees"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--event', type=int, action='append', dest='events',
+                            help='Only rebuild the funnel of the event with this ID. Can be given multiple times.')
+
+    def handle(self, *args, **options):
+        with scopes_disabled():
+            events = Event.objects.filter(plugins__contains='pretix_ticket_request')
+            if options['events']:
+                events = events.filter(pk__in=options['events'])
+
+            for event in events:
+                count = self.backfill(event)
+                self.stdout.write('{}: {} days'.format(event.slug, count))
+
+    def backfill(self, event):
+        tz = event.timezone
+        counts = defaultdict(Counter)
+
+        def day(dt):
+            return dt.astimezone(tz).date()
+
+        # Rows are streamed in chunks and only their timestamps are loaded.
+        requests = event.ticket_requests.values_list('created_at', 'approved_at', 'redeemed_at')
+        for created_at, approved_at, redeemed_at in requests.iterator(chunk_size=CHUNK_SIZE):
+            counts[day(created_at)]['requested'] += 1
+            if approved_at:
+                counts[day(approved_at)]['approved'] += 1
+            if redeemed_at:
+                counts[day(redeemed_at)]['redeemed'] += 1
+
+        # Attendees are only created once their email is verified, and the
+        # profile step is the only other write, so updated_at marks it.
+        attendees = event.attendees.filter(verified=True).values_list('created_at', 'updated_at', 'profile')
+        for created_at, updated_at, profile in attendees.iterator(chunk_size=CHUNK_SIZE):
+            counts[day(created_at)]['verified'] += 1
+            if profile:
+                counts[day(updated_at)]['profiled'] += 1
+
+        with transaction.atomic():
+            FunnelBucket.objects.filter(event=event).delete()
+            FunnelBucket.objects.bulk_create([
+                FunnelBucket(event=event, date=date, **stages)
+                for date, stages in sorted(counts.items())
+            ], batch_size=500)
+        return len(counts)
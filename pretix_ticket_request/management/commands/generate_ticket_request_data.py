@@ -0,0 +1,219 @@
+import random
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.timezone import now
+from django_scopes import scopes_disabled
+from pretix.base.models import Event, Organizer, Quota, Voucher
+
+from pretix_ticket_request.forms import TicketRequestBaseForm
+from pretix_ticket_request.models import Attendee, TicketRequest
+
+CHUNK_SIZE = 5000
+
+STATUS_WEIGHTS = (
+    (TicketRequest.STATUS_PENDING, 30),
+    (TicketRequest.STATUS_APPROVED, 50),
+    (TicketRequest.STATUS_REJECTED, 15),
+    (TicketRequest.STATUS_WITHDRAWN, 5),
+)
+REDEEMED_SHARE = 0.7
+
+# Answer distributions roughly following past registrations. Choices missing
+# here are drawn with a weight of one.
+GENDER_WEIGHTS = {
+    'Female': 40,
+    'Male': 45,
+    'Gender-nonconforming': 4,
+    'Other': 3,
+    'Prefer not to say': 8,
+}
+PROFESSIONAL_AREA_WEIGHTS = {
+    'Digital Security Training': 12,
+    'Frontline Activism': 10,
+    'Advocacy': 10,
+    'Information Security': 8,
+    'Software/Web Development': 8,
+    'Journalism and Media': 8,
+    'Research/Academia': 7,
+    'Policy/Internet Governance': 7,
+}
+
+
+def _choices(field):
+    return [value for value, label in TicketRequestBaseForm.base_fields[field].choices if value]
+
+
+class AnswerGenerator:
+    """
+    Produce form answers over the choice sets of ``TicketRequestBaseForm``
+    from a seeded random generator.
+    """
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.genders = _choices('gender')
+        self.gender_weights = [GENDER_WEIGHTS.get(g, 1) for g in self.genders]
+        self.years = [y for y in _choices('years_attended_iff') if y != 'Not yet!']
+        self.areas = _choices('professional_areas')
+        self.area_weights = [PROFESSIONAL_AREA_WEIGHTS.get(a, 1) for a in self.areas]
+        # Attendance is concentrated on few countries, which a Zipf-like
+        # weighting over a shuffled country list approximates.
+        self.countries = _choices('country')
+        random.Random(0).shuffle(self.countries)
+        self.country_weights = [1 / (rank + 1) for rank in range(len(self.countries))]
+
+    def _yes(self, probability):
+        return str(self.rng.random() < probability)
+
+    def answers(self, name):
+        rng = self.rng
+        if rng.random() < 0.55:
+            years = ['Not yet!']
+        else:
+            years = sorted(rng.sample(self.years, rng.randint(1, len(self.years))), reverse=True)
+        areas = set(rng.choices(self.areas, weights=self.area_weights, k=rng.randint(1, 3)))
+        return {
+            'public_name': name.split()[0],
+            'years_attended_iff': years,
+            'gender': rng.choices(self.genders, weights=self.gender_weights)[0],
+            'country': rng.choices(self.countries, weights=self.country_weights)[0],
+            'is_refugee': self._yes(0.05),
+            'belongs_to_minority_group': self._yes(0.2),
+            'professional_areas': sorted(areas),
+            'professional_title': rng.choice(['', 'Trainer', 'Researcher', 'Developer', 'Director', 'Journalist']),
+            'organization': rng.choice(['', '', 'Independent', 'NGO {}'.format(rng.randint(1, 500))]),
+            'project': '',
+            'follow_coc': 'True',
+            'subscribe_mailing_list': self._yes(0.6),
+            'receive_mattermost_invite': self._yes(0.4),
+        }
+
+
+class Command(BaseCommand):
+    help = "Generate events with synthetic ticket requests, vouchers and attendees for scale testing"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--organizer', default='synthetic',
+                            help='Slug of the organizer to create the events in. Created if missing.')
+        parser.add_argument('--events', type=int, default=1,
+                            help='Number of events to generate.')
+        parser.add_argument('--requests', type=int, default=10000,
+                            help='Number of ticket requests per event.')
+        parser.add_argument('--attendees', type=int, default=None,
+                            help='Number of verified attendees per event. Defaults to the number of approved requests.')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Seed of the random generator. The same seed generates the same dataset.')
+
+    def handle(self, *args, **options):
+        if options['events'] < 1 or options['requests'] < 0:
+            raise CommandError('At least one event and a non-negative number of requests are required.')
+
+        rng = random.Random(options['seed'])
+        answers = AnswerGenerator(rng)
+
+        with scopes_disabled():
+            organizer, __ = Organizer.objects.get_or_create(
+                slug=options['organizer'], defaults={'name': options['organizer']}
+            )
+            for index in range(options['events']):
+                event = self.create_event(organizer, '{}-{}'.format(options['seed'], index))
+                approved = self.generate_requests(event, rng, answers, options['requests'])
+                attendees = options['attendees'] if options['attendees'] is not None else len(approved)
+                self.generate_attendees(event, rng, answers, approved, options['requests'], attendees)
+                self.stdout.write('{}: {} requests, {} approved, {} attendees'.format(
+                    event.slug, options['requests'], len(approved), attendees
+                ))
+
+    def create_event(self, organizer, suffix):
+        slug = 'synthetic-{}'.format(suffix)
+        if Event.objects.filter(organizer=organizer, slug=slug).exists():
+            raise CommandError('Event {} already exists, pick another seed.'.format(slug))
+
+        event = Event.objects.create(
+            organizer=organizer,
+            name='Synthetic event {}'.format(suffix),
+            slug=slug,
+            date_from=now() + timedelta(days=90),
+            currency='EUR',
+            plugins='pretix_ticket_request',
+        )
+        event.set_defaults()
+        quota = Quota.objects.create(event=event, name='Ticket requests', size=None)
+        event.settings.ticket_request_quota = quota.pk
+        return event
+
+    def generate_requests(self, event, rng, answers, count):
+        quota_id = event.settings.ticket_request_quota
+        statuses, weights = zip(*STATUS_WEIGHTS)
+        approved = []
+
+        for start in range(0, count, CHUNK_SIZE):
+            rows = []
+            for n in range(start, min(start + CHUNK_SIZE, count)):
+                name = 'Synthetic Requester {}'.format(n)
+                rows.append((
+                    n, name, rng.choices(statuses, weights=weights)[0],
+                    answers.answers(name), rng.random() < REDEEMED_SHARE
+                ))
+
+            with transaction.atomic():
+                timestamp = now()
+                codes = {
+                    n: '{}-{:07d}'.format(event.slug.upper(), n)
+                    for n, __, status, __, __ in rows
+                    if status == TicketRequest.STATUS_APPROVED
+                }
+                Voucher.objects.bulk_create([
+                    Voucher(
+                        event=event,
+                        quota_id=quota_id,
+                        code=codes[n],
+                        max_usages=1,
+                        redeemed=1 if redeemed else 0,
+                    )
+                    for n, __, __, __, redeemed in rows
+                    if n in codes
+                ], batch_size=CHUNK_SIZE)
+                voucher_ids = dict(
+                    Voucher.objects.filter(event=event, code__in=codes.values()).values_list('code', 'pk')
+                )
+                TicketRequest.objects.bulk_create([
+                    TicketRequest(
+                        event=event,
+                        name=name,
+                        email=self.request_email(event, n),
+                        status=status,
+                        priority=rng.choice((0, 0, 0, 1, 5)),
+                        data=data,
+                        voucher_id=voucher_ids.get(codes.get(n)),
+                        approved_at=timestamp if n in codes else None,
+                        redeemed_at=timestamp if n in codes and redeemed else None,
+                    )
+                    for n, name, status, data, redeemed in rows
+                ], batch_size=CHUNK_SIZE)
+            approved.extend(sorted(codes))
+
+        return approved
+
+    def generate_attendees(self, event, rng, answers, approved, requests, count):
+        # Attendees verify the email of an approved request. Any surplus gets
+        # addresses past the last request.
+        numbers = approved[:count] + list(range(requests, requests + count - len(approved)))
+        for start in range(0, count, CHUNK_SIZE):
+            attendees = []
+            for n in numbers[start:start + CHUNK_SIZE]:
+                name = 'Synthetic Requester {}'.format(n)
+                profile = dict(answers.answers(name), name=name) if rng.random() < 0.8 else {}
+                attendees.append(Attendee(
+                    event=event,
+                    email=self.request_email(event, n),
+                    verified=True,
+                    profile=profile,
+                ))
+            with transaction.atomic():
+                Attendee.objects.bulk_create(attendees, batch_size=CHUNK_SIZE)
+
+    def request_email(self, event, n):
+        return 'requester{}@{}.example.org'.format(n, event.slug)
@@ -0,0 +1,214 @@
+import cProfile
+import os
+import time
+from contextlib import ExitStack, contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.db import connections
+from django.http import HttpRequest
+
+CACHE_PREFIX = 'pretix_ticket_request_metrics'
+PROFILE_PARAMETER = '_ticket_request_profile'
+
+OPERATIONS = (
+    'request_create',
+    'send_voucher',
+    'verify_account_get',
+    'verify_account_post',
+    'profile_get',
+    'profile_post',
+    'ticket_request_list',
+    'attendee_list',
+)
+MAILS = (
+    'confirmation',
+    'voucher',
+    'verification_code',
+)
+
+
+class Histogram:
+    """
+    A Prometheus histogram whose buckets are kept in the shared Django cache,
+    so observations from all web and worker processes end up in the same
+    series. Only the bucket a value falls into is incremented; the cumulative
+    counts are computed when the metrics are exported.
+
+    This needs a cache shared by all processes, such as the Redis cache
+    pretix is usually deployed with. A local memory cache only shows the
+    observations of the process that exports the metrics. Without a cache
+    (``DummyCache``) nothing is recorded. Every observation costs two cache
+    increments, plus an add for a counter's first value.
+    """
+    def __init__(self, name, documentation, label, label_values, buckets, scale=1000000):
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self.label_values = label_values
+        self.buckets = buckets
+        # Cache counters are integers, so sums are stored in millionths.
+        self.scale = scale
+
+    def _key(self, label_value, suffix):
+        return '{}:{}:{}:{}'.format(CACHE_PREFIX, self.name, label_value, suffix)
+
+    def observe(self, value, label_value):
+        if not recording():
+            return
+        bucket = next((b for b in self.buckets if value <= b), '+Inf')
+        _incr(self._key(label_value, bucket))
+        _incr(self._key(label_value, 'sum'), int(value * self.scale))
+
+    def render(self):
+        keys = [
+            self._key(label_value, suffix)
+            for label_value in self.label_values
+            for suffix in tuple(self.buckets) + ('+Inf', 'sum')
+        ]
+        values = cache.get_many(keys)
+
+        lines = [
+            '# HELP {} {}'.format(self.name, self.documentation),
+            '# TYPE {} histogram'.format(self.name),
+        ]
+        for label_value in self.label_values:
+            cumulative = 0
+            for bucket in tuple(self.buckets) + ('+Inf',):
+                cumulative += values.get(self._key(label_value, bucket), 0)
+                lines.append('{}_bucket{{{}="{}",le="{}"}} {}'.format(
+                    self.name, self.label, label_value, bucket, cumulative
+                ))
+            lines.append('{}_sum{{{}="{}"}} {}'.format(
+                self.name, self.label, label_value, values.get(self._key(label_value, 'sum'), 0) / self.scale
+            ))
+            lines.append('{}_count{{{}="{}"}} {}'.format(
+                self.name, self.label, label_value, cumulative
+            ))
+        return '\n'.join(lines)
+
+
+def recording():
+    """
+    Whether observations are kept. The dummy cache drops every value, so
+    there is nothing to record them in.
+    """
+    return not isinstance(caches['default'], DummyCache)
+
+
+def _incr(key, delta=1):
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        # The key does not exist yet. If another process creates it between
+        # our failed incr and the add, add() returns False and we retry.
+        if not cache.add(key, delta, timeout=None):
+            cache.incr(key, delta)
+
+
+LATENCY = Histogram(
+    'pretix_ticket_request_duration_seconds',
+    'Time spent in the plugin\'s hot paths.',
+    'operation', OPERATIONS,
+    (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10),
+)
+QUERIES = Histogram(
+    'pretix_ticket_request_db_queries',
+    'Number of database queries issued by the plugin\'s hot paths.',
+    'operation', OPERATIONS,
+    (1, 2, 5, 10, 20, 50, 100, 200),
+    scale=1,
+)
+MAIL_DURATION = Histogram(
+    'pretix_ticket_request_mail_duration_seconds',
+    'Time spent rendering and queueing outgoing mails.',
+    'mail', MAILS,
+    (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5),
+)
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def _profile_path(operation):
+    directory = getattr(settings, 'PROFILE_DIR', os.path.join(settings.DATA_DIR, 'profiles'))
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, 'ticket_request_{}_{}.prof'.format(operation, int(time.time() * 1000)))
+
+
+def _profiling_requested(request):
+    """
+    Staff members with an active staff session can profile a single request
+    by adding the ``_ticket_request_profile`` query parameter.
+    """
+    if request is None or PROFILE_PARAMETER not in request.GET:
+        return False
+    user = getattr(request, 'user', None)
+    return bool(
+        user and user.is_authenticated and user.is_staff
+        and user.has_active_staff_session(request.session.session_key)
+    )
+
+
+@contextmanager
+def measure(operation, request=None):
+    counter = QueryCounter()
+    profiler = cProfile.Profile() if _profiling_requested(request) else None
+    start = time.perf_counter()
+
+    if profiler:
+        profiler.enable()
+    try:
+        with ExitStack() as stack:
+            # Queries are counted on every configured database, including
+            # read replicas.
+            for conn in connections.all():
+                stack.enter_context(conn.execute_wrapper(counter))
+            yield
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(_profile_path(operation))
+        LATENCY.observe(time.perf_counter() - start, operation)
+        QUERIES.observe(counter.count, operation)
+
+
+@contextmanager
+def measure_mail(mail):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        MAIL_DURATION.observe(time.perf_counter() - start, mail)
+
+
+def instrumented(operation):
+    """
+    Decorate a view, view method or checkout step method so that its latency
+    and query count are recorded under ``operation``.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            request = next((a for a in args if isinstance(a, HttpRequest)), None)
+            if request is None and args:
+                request = getattr(args[0], 'request', None)
+            with measure(operation, request=request):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def render_metrics():
+    lines = [h.render() for h in (LATENCY, QUERIES, MAIL_DURATION)]
+    if not recording():
+        lines.insert(0, '# Nothing is recorded while the Django cache is a DummyCache.')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,31 @@
+from django.db import migrations
+
+
+def create_profile_index(apps, schema_editor):
+    # jsonb_path_ops only supports containment (@>), which is all the
+    # attendee filters use, and is considerably smaller than the default
+    # GIN operator class. Other databases keep the JSON as text, so there
+    # is nothing to index there.
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS pretix_ticket_request_attendee_profile_gin '
+        'ON pretix_ticket_request_attendee USING gin (profile jsonb_path_ops)'
+    )
+
+
+def drop_profile_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS pretix_ticket_request_attendee_profile_gin')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pretix_ticket_request', '0007_attendee'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_profile_index, drop_profile_index),
+    ]
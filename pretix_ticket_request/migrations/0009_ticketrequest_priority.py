@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pretix_ticket_request', '0008_attendee_profile_gin'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ticketrequest',
+            name='priority',
+            field=models.IntegerField(default=0, help_text='Requests with a higher priority are approved first when approving automatically by priority.', verbose_name='Priority'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+from django.db import migrations, models
+
+
+def set_approved_at(apps, schema_editor):
+    TicketRequest = apps.get_model('pretix_ticket_request', 'TicketRequest')
+    TicketRequest.objects.filter(status='approved').update(approved_at=models.F('updated_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pretix_ticket_request', '0009_ticketrequest_priority'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ticketrequest',
+            name='approved_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(set_approved_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pretix_ticket_request', '0010_ticketrequest_approved_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ticketrequest',
+            name='redeemed_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,30 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pretixbase', '0141_seat_sorting_rank'),
+        ('pretix_ticket_request', '0011_ticketrequest_redeemed_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FunnelBucket',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False)),
+                ('date', models.DateField()),
+                ('requested', models.PositiveIntegerField(default=0)),
+                ('approved', models.PositiveIntegerField(default=0)),
+                ('redeemed', models.PositiveIntegerField(default=0)),
+                ('verified', models.PositiveIntegerField(default=0)),
+                ('profiled', models.PositiveIntegerField(default=0)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ticket_request_funnel', to='pretixbase.Event')),
+            ],
+            options={
+                'ordering': ['date'],
+                'unique_together': {('event', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,190 @@
+import base64
+import binascii
+import hashlib
+from datetime import datetime, timezone
+
+from django.db import migrations, models, transaction
+import django.db.models.deletion
+
+CHUNK_SIZE = 500
+
+# A frozen copy of pretix_ticket_request.pgp as of this migration, so later
+# changes to the module do not change what this migration computes.
+ALGORITHMS = {
+    1: 'RSA',
+    2: 'RSA',
+    3: 'RSA',
+    16: 'ElGamal',
+    17: 'DSA',
+    18: 'ECDH',
+    19: 'ECDSA',
+    22: 'EdDSA',
+}
+
+# Curve OIDs as they appear in key packets, with their key sizes.
+CURVES = {
+    bytes.fromhex('2a8648ce3d030107'): 256,  # NIST P-256
+    bytes.fromhex('2b81040022'): 384,  # NIST P-384
+    bytes.fromhex('2b81040023'): 521,  # NIST P-521
+    bytes.fromhex('2b06010401da470f01'): 256,  # Ed25519
+    bytes.fromhex('2b060104019755010501'): 256,  # Curve25519
+    bytes.fromhex('2b2403030208010107'): 256,  # brainpoolP256r1
+    bytes.fromhex('2b240303020801010b'): 384,  # brainpoolP384r1
+    bytes.fromhex('2b240303020801010d'): 512,  # brainpoolP512r1
+}
+
+
+def _dearmor(text):
+    lines = [line.strip() for line in text.strip().splitlines()]
+    try:
+        start = lines.index('-----BEGIN PGP PUBLIC KEY BLOCK-----')
+        end = lines.index('-----END PGP PUBLIC KEY BLOCK-----', start)
+    except ValueError:
+        raise ValueError('Not an ASCII-armored public key block')
+
+    body = lines[start + 1:end]
+    # Armor headers such as "Comment:" end with the first blank line.
+    if '' in body:
+        body = body[body.index('') + 1:]
+    body = [line for line in body if line and not line.startswith('=')]
+    try:
+        return base64.b64decode(''.join(body), validate=True)
+    except binascii.Error:
+        raise ValueError('Invalid armor encoding')
+
+
+def _first_packet(data):
+    if not data or not data[0] & 0x80:
+        raise ValueError('Invalid packet header')
+
+    if data[0] & 0x40:
+        tag = data[0] & 0x3f
+        first = data[1]
+        if first < 192:
+            length, offset = first, 2
+        elif first < 224:
+            length, offset = ((first - 192) << 8) + data[2] + 192, 3
+        elif first == 255:
+            length, offset = int.from_bytes(data[2:6], 'big'), 6
+        else:
+            raise ValueError('Partial body lengths are not allowed in key packets')
+    else:
+        tag = (data[0] >> 2) & 0x0f
+        length_type = data[0] & 0x03
+        if length_type == 3:
+            raise ValueError('Indeterminate packet length')
+        size = 1 << length_type
+        length, offset = int.from_bytes(data[1:1 + size], 'big'), 1 + size
+
+    body = data[offset:offset + length]
+    if len(body) != length:
+        raise ValueError('Truncated packet')
+    return tag, body
+
+
+def _key_bits(algorithm, material):
+    if algorithm in (1, 2, 3, 16, 17):
+        # The first MPI is the RSA modulus or the DSA/ElGamal prime, prefixed
+        # with its length in bits.
+        return int.from_bytes(material[0:2], 'big')
+    if algorithm in (18, 19, 22):
+        oid = material[1:1 + material[0]]
+        return CURVES.get(oid)
+    return None
+
+
+def summarize_pgp_key(text):
+    """
+    Parse the primary key of an ASCII-armored OpenPGP public key block and
+    return a small summary for display and search. Blocks that cannot be
+    parsed are summarized as invalid rather than rejected, since applicants
+    paste all kinds of things into this field.
+    """
+    try:
+        tag, body = _first_packet(_dearmor(text))
+        if tag != 6:
+            raise ValueError('The block does not start with a public key')
+        version = body[0]
+        if version != 4:
+            raise ValueError('Unsupported key version')
+
+        created = int.from_bytes(body[1:5], 'big')
+        algorithm = body[5]
+        fingerprint = hashlib.sha1(b'\x99' + len(body).to_bytes(2, 'big') + body).hexdigest().upper()
+    except (ValueError, IndexError) as e:
+        return {'valid': False, 'error': str(e)}
+
+    return {
+        'valid': True,
+        'fingerprint': fingerprint,
+        'algorithm': ALGORITHMS.get(algorithm, str(algorithm)),
+        'bits': _key_bits(algorithm, body[6:]),
+        'created': datetime.fromtimestamp(created, timezone.utc).date().isoformat(),
+    }
+
+
+def _move(model, attribute, owner, FreeTextAnswer):
+    rows = model.objects.order_by('pk').values_list('pk', attribute)
+    last_pk = 0
+    while True:
+        chunk = list(rows.filter(pk__gt=last_pk)[:CHUNK_SIZE])
+        if not chunk:
+            return
+        last_pk = chunk[-1][0]
+        with transaction.atomic():
+            for pk, document in chunk:
+                if 'pgp_key' not in (document or {}):
+                    continue
+                value = document.pop('pgp_key')
+                if value:
+                    FreeTextAnswer.objects.create(field='pgp_key', value=value, **{owner: pk})
+                    document['pgp_key_summary'] = summarize_pgp_key(value)
+                model.objects.filter(pk=pk).update(**{attribute: document})
+
+
+def move_pgp_keys(apps, schema_editor):
+    FreeTextAnswer = apps.get_model('pretix_ticket_request', 'FreeTextAnswer')
+    _move(apps.get_model('pretix_ticket_request', 'TicketRequest'), 'data', 'ticket_request_id', FreeTextAnswer)
+    _move(apps.get_model('pretix_ticket_request', 'Attendee'), 'profile', 'attendee_id', FreeTextAnswer)
+
+
+def restore_pgp_keys(apps, schema_editor):
+    FreeTextAnswer = apps.get_model('pretix_ticket_request', 'FreeTextAnswer')
+    for model, attribute, owner in (
+        (apps.get_model('pretix_ticket_request', 'TicketRequest'), 'data', 'ticket_request'),
+        (apps.get_model('pretix_ticket_request', 'Attendee'), 'profile', 'attendee'),
+    ):
+        answers = FreeTextAnswer.objects.filter(field='pgp_key', **{owner + '__isnull': False})
+        for answer in answers.select_related(owner).iterator():
+            instance = getattr(answer, owner)
+            document = getattr(instance, attribute)
+            document.pop('pgp_key_summary', None)
+            document['pgp_key'] = answer.value
+            model.objects.filter(pk=instance.pk).update(**{attribute: document})
+
+
+class Migration(migrations.Migration):
+    # Keys are moved in chunks that are committed one by one, so a large
+    # table is not rewritten in a single transaction.
+    atomic = False
+
+    dependencies = [
+        ('pretix_ticket_request', '0012_funnelbucket'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FreeTextAnswer',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False)),
+                ('field', models.CharField(max_length=50)),
+                ('value', models.TextField()),
+                ('attendee', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='free_text_answers', to='pretix_ticket_request.Attendee')),
+                ('ticket_request', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='free_text_answers', to='pretix_ticket_request.TicketRequest')),
+            ],
+            options={
+                'unique_together': {('attendee', 'field'), ('ticket_request', 'field')},
+            },
+        ),
+        migrations.RunPython(move_pgp_keys, restore_pgp_keys),
+    ]
@@ -0,0 +1,64 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+# The tables are indexed by event first instead of being partitioned by event.
+# Removing the data of a finished event at once, which detaching a partition
+# would have offered, is done by archive.EventArchiver. It packs the event's
+# rows into ArchiveChunk rows and deletes them in bulk.
+#
+# Rows of past events are never updated again, so autovacuum only has to
+# keep up with the current event. Lower thresholds let it run on that churn
+# instead of waiting for a fraction of the whole table to change.
+AUTOVACUUM_SETTINGS = 'autovacuum_vacuum_scale_factor = 0.02, autovacuum_analyze_scale_factor = 0.01'
+TABLES = ('pretix_ticket_request_ticketrequest', 'pretix_ticket_request_attendee')
+
+
+def tune_autovacuum(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table in TABLES:
+        schema_editor.execute('ALTER TABLE {} SET ({})'.format(table, AUTOVACUUM_SETTINGS))
+
+
+def reset_autovacuum(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table in TABLES:
+        schema_editor.execute(
+            'ALTER TABLE {} RESET (autovacuum_vacuum_scale_factor, autovacuum_analyze_scale_factor)'.format(table)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pretixbase', '0141_seat_sorting_rank'),
+        ('pretix_ticket_request', '0013_freetextanswer'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ticketrequest',
+            index=models.Index(fields=['event', 'created_at'], name='ticketrequest_event_created'),
+        ),
+        migrations.AddIndex(
+            model_name='ticketrequest',
+            index=models.Index(fields=['event', 'status', 'created_at'], name='ticketrequest_event_status'),
+        ),
+        migrations.AddIndex(
+            model_name='attendee',
+            index=models.Index(fields=['event', 'created_at'], name='attendee_event_created'),
+        ),
+        # The composite indexes above cover lookups by event alone.
+        migrations.AlterField(
+            model_name='ticketrequest',
+            name='event',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='ticket_requests', to='pretixbase.Event'),
+        ),
+        migrations.AlterField(
+            model_name='attendee',
+            name='event',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='attendees', to='pretixbase.Event'),
+        ),
+        migrations.RunPython(tune_autovacuum, reset_autovacuum),
+    ]
@@ -0,0 +1,30 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pretixbase', '0141_seat_sorting_rank'),
+        ('pretix_ticket_request', '0014_event_scoped_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchiveChunk',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('ticket_request', 'Ticket requests'), ('attendee', 'Attendees')], max_length=20)),
+                ('first_id', models.PositiveIntegerField()),
+                ('last_id', models.PositiveIntegerField()),
+                ('count', models.PositiveIntegerField()),
+                ('payload', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ticket_request_archive', to='pretixbase.Event')),
+            ],
+            options={
+                'ordering': ['kind', 'first_id'],
+                'unique_together': {('event', 'kind', 'first_id')},
+            },
+        ),
+    ]
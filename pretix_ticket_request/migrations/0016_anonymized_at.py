@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pretix_ticket_request', '0015_archivechunk'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ticketrequest',
+            name='anonymized_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='attendee',
+            name='anonymized_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='archivechunk',
+            name='anonymized_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,29 @@
+from django.db import migrations, models
+import django.db.models.deletion
+import jsonfallback.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pretixbase', '0141_seat_sorting_rank'),
+        ('pretix_ticket_request', '0016_anonymized_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingSubmission',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=255)),
+                ('email', models.EmailField(max_length=190)),
+                ('data', jsonfallback.fields.FallbackJSONField(blank=True, default=dict)),
+                ('free_text', jsonfallback.fields.FallbackJSONField(blank=True, default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pending_submissions', to='pretixbase.Event')),
+            ],
+            options={
+                'ordering': ['pk'],
+            },
+        ),
+    ]
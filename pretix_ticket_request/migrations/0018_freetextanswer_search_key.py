@@ -0,0 +1,46 @@
+from django.db import migrations, models, transaction
+
+CHUNK_SIZE = 500
+
+
+def fill_search_keys(apps, schema_editor):
+    # The fingerprints were computed into the summaries when the keys were
+    # moved, so the key blocks do not need to be parsed again.
+    FreeTextAnswer = apps.get_model('pretix_ticket_request', 'FreeTextAnswer')
+    answers = FreeTextAnswer.objects.filter(field='pgp_key').order_by('pk').select_related('ticket_request', 'attendee')
+    last_pk = 0
+    while True:
+        chunk = list(answers.filter(pk__gt=last_pk)[:CHUNK_SIZE])
+        if not chunk:
+            return
+        last_pk = chunk[-1].pk
+        with transaction.atomic():
+            for answer in chunk:
+                if answer.ticket_request_id:
+                    document = answer.ticket_request.data
+                else:
+                    document = answer.attendee.profile
+                summary = (document or {}).get('pgp_key_summary') or {}
+                if summary.get('fingerprint'):
+                    FreeTextAnswer.objects.filter(pk=answer.pk).update(search_key=summary['fingerprint'])
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('pretix_ticket_request', '0017_pendingsubmission'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='freetextanswer',
+            name='search_key',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.RunPython(fill_search_keys, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='freetextanswer',
+            index=models.Index(fields=['field', 'search_key'], name='freetextanswer_search'),
+        ),
+    ]
@@ -1,6 +1,12 @@
+import json
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import RegexValidator
-from django.db import models, transaction
+from django.db import IntegrityError, connections, models, router, transaction
+from django.db.models.expressions import RawSQL
 from django_countries.fields import Country
+from django.utils.timezone import now
 from django.utils.translation import (
     pgettext_lazy, ugettext_lazy as _, ugettext_noop,
 )
@@ -14,6 +20,117 @@ from pretix.base.email import get_email_context
 from pretix.base.services.mail import mail
 from pretix.multidomain.urlreverse import build_absolute_uri
 
+from .metrics import instrumented, measure_mail
+from .pgp import pgp_key_fingerprint
+from .services import QuotaExhausted, QuotaSnapshot, VoucherPool
+
+
+def update_json_fields(instance, attribute, changes, **fields):
+    """
+    Persist ``changes`` to the JSON field ``attribute`` of ``instance`` and
+    the plain model ``fields`` with a single UPDATE of only those columns.
+
+    On PostgreSQL only the changed keys are merged into the stored document;
+    elsewhere the merged document is written. Nothing is written, and
+    ``updated_at`` is left alone, if there are no changes. Returns whether a
+    write happened.
+    """
+    if not changes and not fields:
+        return False
+
+    model = type(instance)
+    connection = connections[router.db_for_write(model)]
+    update = dict(fields, updated_at=now())
+
+    if changes:
+        document = getattr(instance, attribute)
+        document.update(changes)
+        if connection.vendor == 'postgresql':
+            field = model._meta.get_field(attribute)
+            update[attribute] = RawSQL(
+                '{} || %s::jsonb'.format(connection.ops.quote_name(field.column)),
+                [json.dumps(changes)],
+                output_field=field,
+            )
+        else:
+            update[attribute] = document
+
+    model.objects.filter(pk=instance.pk).update(**update)
+    for name, value in update.items():
+        if name != attribute:
+            setattr(instance, name, value)
+    return True
+
+
+def delete_rows(model, pks):
+    """
+    Delete the rows of ``model`` with the primary keys ``pks`` in a single
+    DELETE statement and return their number. Related objects are not
+    collected and no delete signals are sent, so callers remove dependent
+    rows themselves.
+    """
+    if not pks:
+        return 0
+
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'DELETE FROM {} WHERE {} IN ({})'.format(
+                quote(model._meta.db_table), quote(model._meta.pk.column), ', '.join(['%s'] * len(pks))
+            ),
+            list(pks),
+        )
+        return cursor.rowcount
+
+
+def insert_rows(model, objs, key):
+    """
+    Insert ``objs`` into the table of ``model``, skipping every object that
+    violates a unique constraint, and return a dictionary that maps the
+    ``key`` field of each inserted row to its primary key. Like
+    ``bulk_create``, this sends no save signals.
+
+    PostgreSQL does this in one ``INSERT ... ON CONFLICT DO NOTHING RETURNING``
+    statement. Other databases insert row by row, each row in its own
+    savepoint, because they cannot tell which rows of a bulk insert were
+    skipped. ``key`` must be unique, since it is used to look up the new
+    primary keys there.
+    """
+    if not objs:
+        return {}
+
+    connection = connections[router.db_for_write(model)]
+    if connection.vendor != 'postgresql':
+        inserted = []
+        for obj in objs:
+            try:
+                with transaction.atomic(using=connection.alias):
+                    model.objects.using(connection.alias).bulk_create([obj])
+            except IntegrityError:
+                continue
+            inserted.append(getattr(obj, key))
+        return dict(model.objects.using(connection.alias).filter(**{key + '__in': inserted}).values_list(key, 'pk'))
+
+    fields = [field for field in model._meta.concrete_fields if not field.primary_key]
+    quote = connection.ops.quote_name
+    params = []
+    for obj in objs:
+        params += [field.get_db_prep_save(field.pre_save(obj, True), connection) for field in fields]
+    row = '({})'.format(', '.join(['%s'] * len(fields)))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'INSERT INTO {} ({}) VALUES {} ON CONFLICT DO NOTHING RETURNING {}, {}'.format(
+                quote(model._meta.db_table),
+                ', '.join(quote(field.column) for field in fields),
+                ', '.join([row] * len(objs)),
+                quote(model._meta.get_field(key).column),
+                quote(model._meta.pk.column),
+            ),
+            params,
+        )
+        return dict(cursor.fetchall())
+
 
 class TicketRequest(LoggedModel):
     STATUS_PENDING = "pending"
@@ -27,7 +144,9 @@ class TicketRequest(LoggedModel):
         (STATUS_WITHDRAWN, _("withdrawn")),
     )
 
-    event = models.ForeignKey('pretixbase.Event', on_delete=models.CASCADE, related_name="ticket_requests")
+    event = models.ForeignKey(
+        'pretixbase.Event', on_delete=models.CASCADE, related_name="ticket_requests", db_index=False
+    )
     voucher = models.ForeignKey(
         'pretixbase.Voucher',
         verbose_name=_("Assigned voucher"),
@@ -54,16 +173,24 @@ class TicketRequest(LoggedModel):
         db_index=True,
         default=STATUS_PENDING
     )
+    priority = models.IntegerField(
+        default=0,
+        verbose_name=_("Priority"),
+        help_text=_("Requests with a higher priority are approved first when approving automatically by priority."),
+    )
     data = FallbackJSONField(
         blank=True, default=dict
     )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    approved_at = models.DateTimeField(null=True, blank=True)
+    redeemed_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    anonymized_at = models.DateTimeField(null=True, blank=True)
 
     def approved(self):
         return self.status == self.STATUS_APPROVED
 
-    def approve(self, user=None):
+    def approve(self, user=None, quota_cache=None):
         # return if status is not equal to 'pending'
         if self.status != TicketRequest.STATUS_PENDING:
             return False
@@ -71,11 +198,13 @@ class TicketRequest(LoggedModel):
         # set status to approved if ticket request has a voucher assigned
         if self.voucher:
             self.status = TicketRequest.STATUS_APPROVED
+            self.approved_at = now()
             self.save()
+            FunnelBucket.bump(self.event, 'approved')
             return False
 
         self.status = TicketRequest.STATUS_APPROVED
-        self.send_voucher(self, user=user)
+        self.send_voucher(quota_cache=quota_cache, user=user)
 
     def reject(self, user=None):
         if self.status != TicketRequest.STATUS_PENDING:
@@ -89,35 +218,68 @@ class TicketRequest(LoggedModel):
     def country(self):
         return Country(code=self.data.get('country'))
 
+    @instrumented('send_voucher')
     def send_voucher(self, quota_cache=None, user=None):
+        """
+        Assign a voucher to this ticket request and mail it once the
+        transaction commits.
+
+        ``quota_cache`` is a ``QuotaSnapshot`` shared by batch approvals, which
+        release its reservations if their transaction fails. Raises
+        ``QuotaExhausted`` if the quota has no room left.
+        """
         event = self.event
         quota_id = event.settings.ticket_request_quota
-        quota = event.quotas.get(id=quota_id)
-        locale = 'en'
+
+        from .tasks import schedule_voucher_pool_refill
+
+        comment = _('Automatically created from ticket request entry for {email}').format(
+            email=self.email
+        )
 
         with transaction.atomic():
-            v = Voucher.objects.create(
-                event=event,
-                max_usages=1,
-                quota=quota,
-                tag='ticket-request',
-                valid_until=event.date_to,
-                comment=_('Automatically created from ticket request entry for {email}').format(
-                    email=self.email
-                ),
-                block_quota=True,
-            )
-            v.log_action('pretix.voucher.approved.ticket_request', {
-                'quota': quota,
-                'tag': 'ticket-request',
-                'block_quota': True,
-                'valid_until': v.valid_until.isoformat(),
-                'max_usages': 1,
-                'email': self.email,
-            }, user=user)
-            self.log_action('pretix.ticket_request.approved', user=user)
-            self.voucher = v
-            self.save()
+            if quota_cache is None:
+                quota_cache = QuotaSnapshot(event=event, quota=event.quotas.get(id=quota_id))
+            quota = quota_cache.quota
+
+            if not quota_cache.reserve():
+                raise QuotaExhausted(_('The ticket request quota has no capacity left.'))
+            try:
+                # Prefer a pre-generated voucher from the pool and only create one
+                # on the request path if the pool has run dry.
+                v = VoucherPool(event=event, quota=quota).claim(comment=comment, user=user)
+                if v is None:
+                    v = Voucher.objects.create(
+                        event=event,
+                        max_usages=1,
+                        quota=quota,
+                        tag='ticket-request',
+                        valid_until=event.date_to,
+                        comment=comment,
+                        block_quota=True,
+                    )
+                v.log_action('pretix.voucher.approved.ticket_request', {
+                    'quota': quota,
+                    'tag': 'ticket-request',
+                    'block_quota': True,
+                    'valid_until': v.valid_until.isoformat(),
+                    'max_usages': 1,
+                    'email': self.email,
+                }, user=user)
+                self.log_action('pretix.ticket_request.approved', user=user)
+                self.voucher = v
+                self.approved_at = now()
+                self.save()
+                FunnelBucket.bump(event, 'approved')
+            except BaseException:
+                quota_cache.release(1)
+                raise
+            schedule_voucher_pool_refill(event)
+            transaction.on_commit(self.send_voucher_mail)
+
+    def send_voucher_mail(self):
+        event = self.event
+        locale = 'en'
 
         with language(locale):
             email_content = LazyI18nString.from_gettext(ugettext_noop("""Congratulations!! You just got approved for an IFF Ticket. You can redeem it in our ticket shop by entering the following voucher code following the directions listed below:
@@ -193,21 +355,29 @@ ticket code.
                 'code': self.voucher.code
             }
 
-            mail(
-                self.email,
-                _('Claim your IFF Ticket!!').format(event=str(event)),
-                email_content,
-                email_context,
-                event,
-                locale=locale
-            )
+            with measure_mail('voucher'):
+                mail(
+                    self.email,
+                    _('Claim your IFF Ticket!!').format(event=str(event)),
+                    email_content,
+                    email_context,
+                    event,
+                    locale=locale
+                )
 
     class Meta:
         ordering = ['created_at', 'status']
+        # Every query is scoped to one event, so all indexes lead with it.
+        indexes = [
+            models.Index(fields=['event', 'created_at'], name='ticketrequest_event_created'),
+            models.Index(fields=['event', 'status', 'created_at'], name='ticketrequest_event_status'),
+        ]
 
 
 class Attendee(LoggedModel):
-    event = models.ForeignKey('pretixbase.Event', on_delete=models.CASCADE, related_name="attendees")
+    event = models.ForeignKey(
+        'pretixbase.Event', on_delete=models.CASCADE, related_name="attendees", db_index=False
+    )
     verified = models.BooleanField(default=False)
     email = models.EmailField(
         unique=True,
@@ -222,9 +392,209 @@ class Attendee(LoggedModel):
     )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    anonymized_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['event', 'created_at'], name='attendee_event_created'),
+        ]
 
     def has_profile(self):
         return self.profile
+
+    @classmethod
+    def upsert_verified(cls, event, email):
+        """
+        Create a verified attendee for ``email`` or touch the existing one in a
+        single atomic statement and return ``(id, created)``.
+
+        Since emails are unique across all events, ``(None, False)`` is returned
+        if the email already belongs to an attendee of another event.
+        """
+        connection = connections[router.db_for_write(cls)]
+        timestamp = now()
+
+        if connection.vendor == 'postgresql':
+            table = connection.ops.quote_name(cls._meta.db_table)
+            with connection.cursor() as cursor:
+                # xmax is only zero for freshly inserted row versions, which
+                # tells inserts apart from updates of an existing row.
+                cursor.execute(
+                    'INSERT INTO {table} (event_id, email, verified, profile, created_at, updated_at) '
+                    'VALUES (%s, %s, true, %s::jsonb, %s, %s) '
+                    'ON CONFLICT (email) DO UPDATE SET updated_at = EXCLUDED.updated_at '
+                    'WHERE {table}.event_id = EXCLUDED.event_id '
+                    'RETURNING id, (xmax = 0)'.format(table=table),
+                    [event.pk, email, '{}', timestamp, timestamp]
+                )
+                row = cursor.fetchone()
+            return tuple(row) if row else (None, False)
+
+        try:
+            with transaction.atomic():
+                return cls.objects.create(event=event, email=email, verified=True).pk, True
+        except IntegrityError:
+            pk = cls.objects.filter(event=event, email=email).values_list('pk', flat=True).first()
+            if pk:
+                cls.objects.filter(pk=pk).update(updated_at=timestamp)
+            return pk, False
+
+
+class FunnelBucket(models.Model):
+    """
+    Daily counters of how many applicants reached each stage from ticket
+    request to completed attendee profile. They are incremented on the
+    corresponding state transitions, so reading the funnel never has to
+    touch the ticket request or attendee tables.
+    """
+    STAGES = ('requested', 'approved', 'redeemed', 'verified', 'profiled')
+
+    event = models.ForeignKey('pretixbase.Event', on_delete=models.CASCADE, related_name="ticket_request_funnel")
+    date = models.DateField()
+    requested = models.PositiveIntegerField(default=0)
+    approved = models.PositiveIntegerField(default=0)
+    redeemed = models.PositiveIntegerField(default=0)
+    verified = models.PositiveIntegerField(default=0)
+    profiled = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['date']
+        unique_together = (('event', 'date'),)
+
+    @classmethod
+    def bump(cls, event, stage, count=1):
+        """
+        Add ``count`` to today's ``stage`` counter of ``event``.
+        """
+        date = now().astimezone(event.timezone).date()
+        increment = {stage: models.F(stage) + count}
+
+        if cls.objects.filter(event=event, date=date).update(**increment):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(event=event, date=date, **{stage: count})
+        except IntegrityError:
+            # Another process created today's bucket in the meantime.
+            cls.objects.filter(event=event, date=date).update(**increment)
+
+    @classmethod
+    def revert(cls, event, stage, date, count=1):
+        """
+        Take back ``count`` of the ``stage`` transitions counted on ``date``,
+        e.g. for redemptions whose order was canceled. Counters never drop
+        below zero.
+        """
+        decrement = {stage: models.F(stage) - count}
+        if not cls.objects.filter(event=event, date=date, **{stage + '__gte': count}).update(**decrement):
+            cls.objects.filter(event=event, date=date).update(**{stage: 0})
+
+
+class FreeTextAnswer(models.Model):
+    """
+    Long free-text answers, such as pasted PGP key blocks, kept out of the
+    ``data``/``profile`` documents so list, filter and export queries do not
+    have to read them. Only the detail views load them.
+
+    Answers that can be searched for carry a short, indexed ``search_key``
+    derived from the value, such as the fingerprint of a PGP key.
+    """
+    # Functions deriving the search key from the value, per field.
+    SEARCH_KEYS = {
+        'pgp_key': pgp_key_fingerprint,
+    }
+
+    ticket_request = models.ForeignKey(
+        TicketRequest,
+        null=True, blank=True,
+        on_delete=models.CASCADE,
+        related_name='free_text_answers',
+    )
+    attendee = models.ForeignKey(
+        Attendee,
+        null=True, blank=True,
+        on_delete=models.CASCADE,
+        related_name='free_text_answers',
+    )
+    field = models.CharField(max_length=50)
+    value = models.TextField()
+    search_key = models.CharField(max_length=64, blank=True, default='')
+
+    class Meta:
+        unique_together = (('ticket_request', 'field'), ('attendee', 'field'))
+        indexes = [
+            models.Index(fields=['field', 'search_key'], name='freetextanswer_search'),
+        ]
+
+    @classmethod
+    def search_key_for(cls, field, value):
+        derive = cls.SEARCH_KEYS.get(field)
+        return derive(value) if derive and value else ''
+
+    def save(self, *args, **kwargs):
+        # Bulk inserts bypass this, they set the search key themselves.
+        self.search_key = self.search_key_for(self.field, self.value)
+        super().save(*args, **kwargs)
+
+
+class ArchiveChunk(models.Model):
+    """
+    A batch of ticket requests or attendees of a finished event, moved out of
+    the live tables as zlib-compressed JSON lines.
+    """
+    KIND_TICKET_REQUEST = 'ticket_request'
+    KIND_ATTENDEE = 'attendee'
+    KIND_CHOICES = (
+        (KIND_TICKET_REQUEST, _('Ticket requests')),
+        (KIND_ATTENDEE, _('Attendees')),
+    )
+
+    event = models.ForeignKey('pretixbase.Event', on_delete=models.CASCADE, related_name="ticket_request_archive")
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    first_id = models.PositiveIntegerField()
+    last_id = models.PositiveIntegerField()
+    count = models.PositiveIntegerField()
+    payload = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    anonymized_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['kind', 'first_id']
+        unique_together = (('event', 'kind', 'first_id'),)
+
+    @classmethod
+    def pack(cls, event, kind, records):
+        """
+        Build an unsaved chunk from ``records``, a list of dictionaries
+        ordered by their ``id``.
+        """
+        lines = '\n'.join(json.dumps(record, cls=DjangoJSONEncoder, sort_keys=True) for record in records)
+        return cls(
+            event=event,
+            kind=kind,
+            first_id=records[0]['id'],
+            last_id=records[-1]['id'],
+            count=len(records),
+            payload=zlib.compress(lines.encode(), 9),
+        )
+
+    def records(self):
+        return [json.loads(line) for line in zlib.decompress(bytes(self.payload)).decode().split('\n')]
+
+
+class PendingSubmission(models.Model):
+    """
+    A validated ticket request form staged for ``SubmissionDrainer``, which
+    turns batches of them into ticket requests when buffered ingestion is
+    enabled.
+    """
+    event = models.ForeignKey('pretixbase.Event', on_delete=models.CASCADE, related_name="pending_submissions")
+    name = models.CharField(max_length=255)
+    email = models.EmailField(max_length=190)
+    data = FallbackJSONField(blank=True, default=dict)
+    free_text = FallbackJSONField(blank=True, default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['pk']
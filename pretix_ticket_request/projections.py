@@ -0,0 +1,58 @@
+from collections import namedtuple
+
+from django.db import connections
+from django.db.models import F
+from django_countries.fields import Country
+from jsonfallback.functions import JSONExtract
+
+
+class TicketRequestRow(namedtuple('TicketRequestRow', (
+    'id', 'email', 'status', 'created_at', 'updated_at', 'redeemed_at', 'voucher_id', 'voucher_code',
+    'country_code',
+))):
+    """
+    The columns of a ticket request shown in the control list. The ``data``
+    document is never loaded where the database can extract the country
+    itself.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_values(cls, values):
+        *columns, country = values
+        if isinstance(country, dict):
+            # Loaded by the fallback of ``ticket_request_rows``.
+            country = country.get('country')
+        return cls(*columns, country)
+
+    @property
+    def country(self):
+        return Country(code=self.country_code)
+
+
+class AttendeeRow(namedtuple('AttendeeRow', (
+    'id', 'email', 'verified', 'created_at', 'updated_at',
+))):
+    __slots__ = ()
+
+
+def ticket_request_rows(qs):
+    """
+    Select the columns of ``TicketRequestRow`` from ``qs``. Only PostgreSQL
+    and MySQL can extract the country from the JSON document, other databases
+    store it as text and return the whole document instead. Build the rows
+    with ``TicketRequestRow.from_values`` in either case.
+    """
+    if connections[qs.db].vendor in ('postgresql', 'mysql'):
+        country = JSONExtract('data', 'country')
+    else:
+        country = 'data'
+    return qs.values_list(
+        'id', 'email', 'status', 'created_at', 'updated_at', 'redeemed_at', 'voucher_id',
+        F('voucher__code'),
+        country,
+    )
+
+
+def attendee_rows(qs):
+    return qs.values_list(*AttendeeRow._fields)
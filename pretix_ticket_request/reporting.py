@@ -0,0 +1,249 @@
+from collections import Counter, OrderedDict
+from itertools import product
+
+from django.db import connections
+from django.utils.translation import ugettext_lazy as _
+from django_countries.fields import Country
+
+from .models import Attendee, TicketRequest
+from .routing import replica_database
+
+REPORT_CACHE_KEY = 'pretix_ticket_request_report_{}'
+REPORT_CACHE_TTL = 3600
+# Reports read from a replica may lag behind writes that already invalidated
+# the cache, so they are only kept briefly.
+REPLICA_REPORT_CACHE_TTL = 60
+CHUNK_SIZE = 2000
+
+STAGE_REQUESTED = 'requested'
+STAGE_APPROVED = 'approved'
+STAGE_ATTENDED = 'attended'
+STAGES = (
+    (STAGE_REQUESTED, _('Requested')),
+    (STAGE_APPROVED, _('Approved')),
+    (STAGE_ATTENDED, _('Attended')),
+)
+
+
+def _single(key):
+    def extract(document):
+        return (str(document.get(key) or ''),)
+    return extract
+
+
+def _multiple(key):
+    def extract(document):
+        values = document.get(key) or ()
+        if isinstance(values, str):
+            values = (values,)
+        return tuple(values) or ('',)
+    return extract
+
+
+def _first_time(document):
+    years = document.get('years_attended_iff') or ()
+    return ('True' if not years or 'Not yet!' in years else 'False',)
+
+
+# The SQL counterparts of the extractors above, for PostgreSQL. Each takes the
+# quoted JSON column and returns the column expression and, for multi-valued
+# answers, a lateral join that yields one row per selected value.
+
+def _single_sql(key):
+    def extract(column):
+        value = "{}->'{}'".format(column, key)
+        return (
+            "CASE WHEN jsonb_typeof({value}) = 'boolean' THEN "
+            "CASE WHEN ({value})::boolean THEN 'True' ELSE '' END "
+            "ELSE COALESCE({column}->>'{key}', '') END"
+        ).format(value=value, column=column, key=key), None
+    return extract
+
+
+def _multiple_sql(key):
+    def extract(column):
+        value = "{}->'{}'".format(column, key)
+        alias = 'values_{}'.format(key)
+        join = (
+            "CROSS JOIN LATERAL jsonb_array_elements_text(CASE "
+            "WHEN jsonb_typeof({value}) = 'array' AND jsonb_array_length({value}) > 0 THEN {value} "
+            "ELSE jsonb_build_array(COALESCE({column}->>'{key}', '')) END) AS {alias}(value)"
+        ).format(value=value, column=column, key=key, alias=alias)
+        return '{}.value'.format(alias), join
+    return extract
+
+
+def _first_time_sql(column):
+    value = "{}->'years_attended_iff'".format(column)
+    return (
+        "CASE WHEN jsonb_typeof({value}) = 'array' THEN "
+        "CASE WHEN jsonb_array_length({value}) = 0 OR {value} @> '[\"Not yet!\"]' THEN 'True' ELSE 'False' END "
+        "WHEN COALESCE({column}->>'years_attended_iff', '') = '' "
+        "OR strpos({column}->>'years_attended_iff', 'Not yet!') > 0 THEN 'True' "
+        "ELSE 'False' END"
+    ).format(value=value, column=column), None
+
+
+# The labels of ``is_refugee`` and ``belongs_to_minority_group`` are swapped
+# in TicketRequestBaseForm, so the minority group question is stored under
+# ``is_refugee``. We report by the question that was actually asked.
+DIMENSIONS = OrderedDict((
+    ('country', (_('Country'), _single('country'), _single_sql('country'))),
+    ('gender', (_('Gender'), _single('gender'), _single_sql('gender'))),
+    ('first_time', (_('First-time attendee'), _first_time, _first_time_sql)),
+    ('professional_areas', (_('Professional area'), _multiple('professional_areas'), _multiple_sql('professional_areas'))),
+    ('minority_group', (_('Minority group'), _single('is_refugee'), _single_sql('is_refugee'))),
+    ('refugee_diaspora', (_('Refugee diaspora'), _single('belongs_to_minority_group'), _single_sql('belongs_to_minority_group'))),
+))
+
+CROSSTABS = OrderedDict((
+    ('country_gender_first_time', ('country', 'gender', 'first_time')),
+    ('professional_area_minority_group', ('professional_areas', 'minority_group')),
+))
+
+
+def _documents(event, using):
+    """
+    Stream (stage, document) pairs for all ticket requests and attendees of
+    ``event``. Only the status and the JSON answers are fetched.
+    """
+    requests = TicketRequest.objects.using(using).filter(event=event).values_list('status', 'data')
+    for status, data in requests.iterator(chunk_size=CHUNK_SIZE):
+        data = data or {}
+        yield STAGE_REQUESTED, data
+        if status == TicketRequest.STATUS_APPROVED:
+            yield STAGE_APPROVED, data
+
+    attendees = Attendee.objects.using(using).filter(event=event, verified=True).values_list('profile', flat=True)
+    for profile in attendees.iterator(chunk_size=CHUNK_SIZE):
+        yield STAGE_ATTENDED, profile or {}
+
+
+def _count_in_python(event, using):
+    """
+    Count all configured cross-tabs in a single pass over the event's rows.
+    Every dimension is extracted at most once per row.
+    """
+    counters = {name: Counter() for name in CROSSTABS}
+    extractors = [(name, [DIMENSIONS[d][1] for d in dims]) for name, dims in CROSSTABS.items()]
+
+    for stage, document in _documents(event, using):
+        values = {}
+        for name, extract_fns in extractors:
+            columns = []
+            for extract in extract_fns:
+                if extract not in values:
+                    values[extract] = extract(document)
+                columns.append(values[extract])
+            counter = counters[name]
+            for combination in product(*columns):
+                counter[combination + (stage,)] += 1
+    return counters
+
+
+def _count_in_database(event, using):
+    """
+    Count all configured cross-tabs with one grouped query per cross-tab and
+    table, so no JSON document is sent to Python.
+    """
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    counters = {name: Counter() for name in CROSSTABS}
+
+    for name, dims in CROSSTABS.items():
+        for model, column, condition, stages in (
+            (TicketRequest, 'data', '', (STAGE_REQUESTED, STAGE_APPROVED)),
+            (Attendee, 'profile', ' AND t.{}'.format(quote('verified')), (STAGE_ATTENDED,)),
+        ):
+            columns, joins = zip(*(DIMENSIONS[d][2]('t.' + quote(column)) for d in dims))
+            counts = ['COUNT(*)']
+            params = []
+            if STAGE_APPROVED in stages:
+                counts.append('COUNT(*) FILTER (WHERE t.{} = %s)'.format(quote('status')))
+                params.append(TicketRequest.STATUS_APPROVED)
+            params.append(event.pk)
+            sql = 'SELECT {} FROM {} t {} WHERE t.{} = %s{} GROUP BY {}'.format(
+                ', '.join(columns + tuple(counts)),
+                quote(model._meta.db_table),
+                ' '.join(join for join in joins if join),
+                quote(model._meta.get_field('event').column),
+                condition,
+                ', '.join(str(i + 1) for i in range(len(dims))),
+            )
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                for row in cursor.fetchall():
+                    for stage, count in zip(stages, row[len(dims):]):
+                        if count:
+                            counters[name][tuple(row[:len(dims)]) + (stage,)] += count
+    return counters
+
+
+def compute_report(event, using='default'):
+    """
+    Compute all configured cross-tabs of ``event``.
+
+    Multi-valued answers such as professional areas count towards every value
+    that was selected. PostgreSQL groups and counts the rows itself; other
+    databases store the answers as text, so the documents are counted here.
+    """
+    if connections[using].vendor == 'postgresql':
+        counters = _count_in_database(event, using)
+    else:
+        counters = _count_in_python(event, using)
+
+    report = OrderedDict()
+    for name, dims in CROSSTABS.items():
+        counter = counters[name]
+        keys = sorted({key[:-1] for key in counter})
+        report[name] = [
+            key + tuple(counter[key + (stage,)] for stage, __ in STAGES)
+            for key in keys
+        ]
+    return report
+
+
+def get_report(event, using='default'):
+    """
+    Return the cached report of ``event``, computing it from the database
+    ``using`` if needed. Reports computed on the primary are preferred and
+    cached under their own key, which replica reads never overwrite.
+    """
+    cache = event.get_cache()
+    keys = [REPORT_CACHE_KEY.format('default')]
+    if using != 'default':
+        keys.append(REPORT_CACHE_KEY.format(using))
+    cached = cache.get_many(keys)
+    for key in keys:
+        if cached.get(key) is not None:
+            return cached[key]
+
+    report = compute_report(event, using=using)
+    cache.set(
+        REPORT_CACHE_KEY.format(using), report,
+        REPORT_CACHE_TTL if using == 'default' else REPLICA_REPORT_CACHE_TTL
+    )
+    return report
+
+
+def invalidate_report(event):
+    event.get_cache().delete_many({
+        REPORT_CACHE_KEY.format('default'),
+        REPORT_CACHE_KEY.format(replica_database()),
+    })
+
+
+def crosstab_header(name):
+    return [str(DIMENSIONS[d][0]) for d in CROSSTABS[name]] + [str(label) for __, label in STAGES]
+
+
+def crosstab_rows(report, name):
+    """
+    Yield the rows of one cross-tab with display values for country codes.
+    """
+    dims = CROSSTABS[name]
+    for row in report[name]:
+        yield [
+            Country(code=value).name if dim == 'country' and value else value
+            for dim, value in zip(dims, row)
+        ] + list(row[len(dims):])
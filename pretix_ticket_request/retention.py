@@ -0,0 +1,198 @@
+import json
+from datetime import timedelta
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import CharField, Value
+from django.db.models.functions import Cast, Concat
+from django.utils.timezone import now
+from pretix.base.models import LogEntry, Voucher
+
+from .caching import invalidate_redeemed_count
+from .models import ArchiveChunk, Attendee, FreeTextAnswer, TicketRequest, delete_rows
+from .reporting import invalidate_report
+
+MODE_ANONYMIZE = 'anonymize'
+MODE_DELETE = 'delete'
+
+# Keys removed from archived records, mirroring what is cleared in the tables.
+ARCHIVE_PERSONAL_KEYS = {
+    ArchiveChunk.KIND_TICKET_REQUEST: ('name', 'email', 'data', 'free_text'),
+    ArchiveChunk.KIND_ATTENDEE: ('email', 'profile', 'free_text'),
+}
+
+# Models of the archived rows, whose log entries are scrubbed with the chunks.
+ARCHIVE_MODELS = {
+    ArchiveChunk.KIND_TICKET_REQUEST: TicketRequest,
+    ArchiveChunk.KIND_ATTENDEE: Attendee,
+}
+
+
+def _anonymized_email():
+    # Emails are unique, so every row gets its own placeholder.
+    return Concat(Value('anonymized-'), Cast('pk', CharField()), Value('@invalid'))
+
+
+class RetentionEngine:
+    """
+    Anonymize or delete the personal data of an event's applicants once its
+    retention period after the end of the event has passed.
+
+    Rows are processed in small batches, each committed together with a
+    checkpoint in the event settings, so an interrupted run resumes where it
+    stopped. A single run processes at most ``max_batches`` batches to keep
+    periodic runs short; the next run picks up from the checkpoint.
+
+    Ticket requests with a voucher are always anonymized in place instead of
+    deleted, so the link between voucher and request survives for auditing.
+    Rows are removed with plain DELETE statements since their only
+    dependents, free-text answers, are removed first.
+    """
+    CHUNK_SIZE = 200
+    ARCHIVE_CHUNK_SIZE = 5
+    MAX_BATCHES = 25
+
+    def __init__(self, *args, **kwargs):
+        self.event = kwargs.pop('event')
+
+        super().__init__(*args, **kwargs)
+
+        self.mode = self.event.settings.ticket_request_retention_mode
+        self.checkpoint = dict(self.event.settings.ticket_request_retention_checkpoint or {})
+
+    def is_due(self):
+        days = self.event.settings.ticket_request_retention_days
+        if not days:
+            return False
+        end = self.event.date_to or self.event.date_from
+        return end < now() - timedelta(days=days)
+
+    def run(self, max_batches=MAX_BATCHES):
+        """
+        Process up to ``max_batches`` batches, or all remaining rows if it is
+        ``None``, and return the number of rows processed per kind.
+        """
+        steps = (
+            ('ticket_request', TicketRequest.objects, self.CHUNK_SIZE, self._ticket_requests),
+            ('attendee', Attendee.objects, self.CHUNK_SIZE, self._attendees),
+            ('archive', ArchiveChunk.objects, self.ARCHIVE_CHUNK_SIZE, self._archive),
+        )
+        counts = {}
+        batches = 0
+        for step, manager, size, process in steps:
+            counts[step] = 0
+            while max_batches is None or batches < max_batches:
+                with transaction.atomic():
+                    pks = list(
+                        manager.filter(
+                            event=self.event,
+                            pk__gt=self.checkpoint.get(step, 0),
+                            anonymized_at__isnull=True,
+                        ).order_by('pk').select_for_update().values_list('pk', flat=True)[:size]
+                    )
+                    if not pks:
+                        break
+                    process(pks)
+                    self.checkpoint[step] = pks[-1]
+                    self.event.settings.ticket_request_retention_checkpoint = self.checkpoint
+                counts[step] += len(pks)
+                batches += 1
+
+        if any(counts.values()):
+            self.event.log_action('pretix.ticket_request.retention_applied', data=dict(counts, mode=self.mode))
+            invalidate_report(self.event)
+            invalidate_redeemed_count(self.event)
+        return counts
+
+    def _scrub_logs(self, model, pks):
+        # Change log entries carry the submitted form data.
+        LogEntry.objects.filter(
+            content_type=ContentType.objects.get_for_model(model),
+            object_id__in=pks,
+        ).update(data='{}')
+
+    def _scrub_vouchers(self, voucher_ids):
+        """
+        Remove the applicant's email from the comment of the vouchers issued
+        for ticket requests and from the log entries of their approval. The
+        vouchers themselves are kept, since orders may refer to them.
+        """
+        if not voucher_ids:
+            return
+
+        Voucher.objects.filter(pk__in=voucher_ids).update(comment='')
+        entries = list(LogEntry.objects.filter(
+            content_type=ContentType.objects.get_for_model(Voucher),
+            object_id__in=voucher_ids,
+            action_type='pretix.voucher.approved.ticket_request',
+        ).only('pk', 'data'))
+        for entry in entries:
+            data = json.loads(entry.data or '{}')
+            data.pop('email', None)
+            entry.data = json.dumps(data)
+        LogEntry.objects.bulk_update(entries, ['data'])
+
+    def _ticket_requests(self, pks):
+        FreeTextAnswer.objects.filter(ticket_request_id__in=pks).delete()
+        self._scrub_logs(TicketRequest, pks)
+        self._scrub_vouchers(list(
+            TicketRequest.objects.filter(pk__in=pks, voucher__isnull=False).values_list('voucher_id', flat=True)
+        ))
+
+        rows = TicketRequest.objects.filter(pk__in=pks)
+        if self.mode == MODE_DELETE:
+            delete_rows(TicketRequest, list(rows.filter(voucher__isnull=True).values_list('pk', flat=True)))
+        rows.update(
+            name='',
+            email=_anonymized_email(),
+            data={},
+            anonymized_at=now(),
+            updated_at=now(),
+        )
+
+    def _attendees(self, pks):
+        FreeTextAnswer.objects.filter(attendee_id__in=pks).delete()
+        self._scrub_logs(Attendee, pks)
+
+        rows = Attendee.objects.filter(pk__in=pks)
+        if self.mode == MODE_DELETE:
+            delete_rows(Attendee, pks)
+        else:
+            rows.update(
+                email=_anonymized_email(),
+                profile={},
+                anonymized_at=now(),
+                updated_at=now(),
+            )
+
+    def _archive(self, pks):
+        chunks = list(ArchiveChunk.objects.filter(pk__in=pks))
+        # The archived rows are gone, but their log entries still carry the
+        # submitted form data.
+        for kind, model in ARCHIVE_MODELS.items():
+            self._scrub_logs(model, [
+                record['id']
+                for chunk in chunks if chunk.kind == kind
+                for record in chunk.records()
+            ])
+        codes = [
+            record['voucher__code']
+            for chunk in chunks if chunk.kind == ArchiveChunk.KIND_TICKET_REQUEST
+            for record in chunk.records() if record.get('voucher__code')
+        ]
+        self._scrub_vouchers(list(
+            Voucher.objects.filter(event=self.event, code__in=codes).values_list('pk', flat=True)
+        ))
+
+        if self.mode == MODE_DELETE:
+            ArchiveChunk.objects.filter(pk__in=pks).delete()
+            return
+
+        for chunk in chunks:
+            personal = ARCHIVE_PERSONAL_KEYS[chunk.kind]
+            records = [
+                {key: value for key, value in record.items() if key not in personal}
+                for record in chunk.records()
+            ]
+            anonymized = ArchiveChunk.pack(self.event, chunk.kind, records)
+            ArchiveChunk.objects.filter(pk=chunk.pk).update(payload=anonymized.payload, anonymized_at=now())
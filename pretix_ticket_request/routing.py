@@ -0,0 +1,60 @@
+"""
+Database selection for the plugin's read-only backend views.
+
+Reads are sent to pretix' replica database (``DATABASE_REPLICA``) once this
+is enabled in the pretix configuration file::
+
+    [ticket_request]
+    replica=on
+    replica_staleness=10
+
+Write paths always use the primary. A user who just changed something keeps
+reading from the primary for ``replica_staleness`` seconds, so their own
+changes are visible even if the replica lags behind.
+"""
+import time
+
+from django.conf import settings
+
+CONFIG_SECTION = 'ticket_request'
+LAST_WRITE_SESSION_KEY = 'pretix_ticket_request_last_write'
+DEFAULT_STALENESS = 10
+
+
+def _config():
+    return getattr(settings, 'CONFIG_FILE', None)
+
+
+def replica_database():
+    """
+    Return the replica alias if reads may be sent to it, else ``'default'``.
+    """
+    config = _config()
+    if config is None or not config.getboolean(CONFIG_SECTION, 'replica', fallback=False):
+        return 'default'
+    return getattr(settings, 'DATABASE_REPLICA', 'default')
+
+
+def read_database(request=None):
+    """
+    Return the database alias for read-only queries made on behalf of
+    ``request``. Without a request, e.g. in exports, the replica is used
+    whenever it is enabled.
+    """
+    alias = replica_database()
+    if alias == 'default' or request is None:
+        return alias
+
+    last_write = request.session.get(LAST_WRITE_SESSION_KEY)
+    staleness = _config().getint(CONFIG_SECTION, 'replica_staleness', fallback=DEFAULT_STALENESS)
+    if last_write and time.time() - last_write < staleness:
+        return 'default'
+    return alias
+
+
+def mark_written(request):
+    """
+    Pin the reads of ``request``'s session to the primary for a while.
+    """
+    if replica_database() != 'default':
+        request.session[LAST_WRITE_SESSION_KEY] = time.time()
@@ -1,4 +1,11 @@
+import json
+from datetime import timedelta
 from random import randint
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.timezone import now
 from django.utils.translation import (
     pgettext_lazy, ugettext_lazy as _, ugettext_noop,
 )
@@ -7,8 +14,11 @@ from i18nfield.strings import LazyI18nString
 
 from pretix.base.i18n import language
 from pretix.base.email import get_email_context
+from pretix.base.models import LogEntry, Quota, Voucher
 from pretix.base.services.mail import mail
 
+from .metrics import measure_mail
+
 
 class VerificationCodeMailer:
     def __init__(self, *args, **kwargs):
@@ -23,7 +33,8 @@ class VerificationCodeMailer:
         """
         # Generate the verification code and save it
         self._generate_code()
-        self._mail()
+        with measure_mail('verification_code'):
+            self._mail()
 
     def _generate_code(self):
         """
@@ -61,3 +72,495 @@ Your {event} team"""))
             self.event,
             locale=locale
         )
+
+
+class RequestConfirmationMailer:
+    def __init__(self, *args, **kwargs):
+        self.event = kwargs.pop('event')
+        self.email = kwargs.pop('email')
+        self.name = kwargs.pop('name')
+
+        super().__init__(*args, **kwargs)
+
+    def send(self):
+        """
+        Confirm to the applicant that their ticket request was received
+        """
+        with measure_mail('confirmation'):
+            self._mail()
+
+    def _mail(self):
+        locale = 'en'
+        with language(locale):
+            email_content = LazyI18nString.from_gettext(ugettext_noop("""Dear {name} ,
+
+Thank you for applying for an IFF Ticket. We are currently reviewing ticket requests, and as space becomes available, we will be issuing tickets.
+
+If you have any questions, please email team@internetfreedomfestival.org
+
+Best regards,
+Your {event} team"""))
+
+            email_context = {
+                'event': self.event,
+                'name': self.name
+            }
+
+            mail(
+                self.email,
+                _('Your {event} ticket request').format(event=str(self.event)),
+                email_content,
+                email_context,
+                self.event,
+                locale=locale
+            )
+
+
+class QuotaExhausted(Exception):
+    pass
+
+
+class QuotaSnapshot:
+    """
+    The remaining capacity of a quota, shared through the cache so pages and
+    approvals do not each run pretix' quota computation.
+
+    Approvals ``reserve`` their vouchers with an atomic cache decrement and
+    only fall back to ``revalidate``, which recomputes the availability while
+    holding a lock on the quota row, when the counter is missing or runs out.
+    Reservations that are not committed yet are tracked in a second counter,
+    so a recomputation does not hand out places whose vouchers are still
+    being created. The counter expires after ``CACHE_TTL`` seconds, which
+    bounds how long vouchers or orders created outside of this plugin go
+    unnoticed. Without a shared cache every approval locks the quota and
+    recomputes it.
+    """
+    CACHE_KEY = 'pretix_ticket_request_quota_snapshot_{}'
+    PENDING_KEY = 'pretix_ticket_request_quota_pending_{}'
+    CACHE_TTL = 60
+
+    def __init__(self, *args, **kwargs):
+        self.event = kwargs.pop('event')
+        self.quota = kwargs.pop('quota')
+
+        super().__init__(*args, **kwargs)
+
+        # Places reserved through this snapshot that have not been released.
+        self.reserved = 0
+        self._remaining = None
+        self._locked = False
+
+    def _cache_key(self):
+        return self.CACHE_KEY.format(self.quota.pk)
+
+    def _pending_key(self):
+        return self.PENDING_KEY.format(self.quota.pk)
+
+    def _availability(self):
+        # pretix reports unlimited quotas as None, which we store as -1 since
+        # None means "not cached".
+        available = self.quota.availability()[1]
+        return -1 if available is None else available
+
+    @property
+    def remaining(self):
+        if self._remaining is None:
+            self._remaining = cache.get(self._cache_key())
+        if self._remaining is None:
+            self._remaining = self._availability()
+            # Another worker may have seeded the counter in the meantime, in
+            # which case its value, possibly already decremented, wins.
+            if not cache.add(self._cache_key(), self._remaining, self.CACHE_TTL):
+                self._remaining = cache.get(self._cache_key(), self._remaining)
+        return self._remaining
+
+    @property
+    def unlimited(self):
+        return self.quota.size is None
+
+    def reserve(self, count=1):
+        """
+        Reserve ``count`` places and return whether they fit into the quota.
+        Must be called inside a transaction, and places reserved by a
+        transaction that does not commit must be given back with ``release``.
+        """
+        if self.unlimited:
+            return True
+
+        self._change_pending(count)
+        remaining = self._take(count)
+        if remaining is None or remaining < 0:
+            # The counter expired or ran out. It may be stale, so check it
+            # against pretix' own computation before giving up. Without a
+            # shared cache, the value computed while this transaction holds
+            # the quota lock stays valid until it ends.
+            if remaining is not None or not self._locked:
+                self.revalidate(reserving=count)
+                remaining = self._take(count)
+            if remaining is None:
+                remaining = self._remaining - count
+            if remaining < 0:
+                self._change_pending(-count)
+                return False
+
+        self._remaining = remaining
+        self.reserved += count
+        # Once committed, the vouchers are part of pretix' own computation.
+        transaction.on_commit(lambda: self._change_pending(-count))
+        return True
+
+    def release(self, count=None):
+        """
+        Give back ``count`` places, all places reserved through this snapshot
+        by default, after the transaction that reserved them failed.
+        """
+        count = self.reserved if count is None else count
+        if not count:
+            return
+        self.reserved -= count
+        if self._remaining is not None:
+            self._remaining += count
+        self._give_back(count)
+        self._change_pending(-count)
+
+    def _take(self, count):
+        # Returns the decremented counter, or None if it is not cached. Places
+        # that do not fit are given back right away.
+        try:
+            remaining = cache.decr(self._cache_key(), count)
+        except ValueError:
+            return None
+        if remaining < 0:
+            self._give_back(count)
+        return remaining
+
+    def _give_back(self, count):
+        try:
+            cache.incr(self._cache_key(), count)
+        except ValueError:
+            # The counter expired, the next snapshot recomputes it.
+            pass
+
+    def _change_pending(self, delta):
+        cache.add(self._pending_key(), 0, self.CACHE_TTL)
+        try:
+            cache.incr(self._pending_key(), delta)
+        except ValueError:
+            pass
+
+    @classmethod
+    def invalidate(cls, event, quota_id):
+        cache.delete(cls.CACHE_KEY.format(quota_id))
+
+    def revalidate(self, reserving=0):
+        """
+        Recompute the availability under a row lock on the quota. Must be
+        called inside a transaction. ``reserving`` places are already
+        counted as pending but not yet taken from the counter.
+        """
+        Quota.objects.select_for_update().filter(pk=self.quota.pk).first()
+        self._locked = True
+        # Reservations are read before the availability, so one that commits
+        # in between is counted twice rather than not at all.
+        pending = max(cache.get(self._pending_key(), 0) - reserving, 0)
+        available = self._availability()
+        self._remaining = available if available == -1 else max(available - pending, 0)
+        cache.set(self._cache_key(), self._remaining, self.CACHE_TTL)
+
+
+def approve_many(event, quota, ticket_requests, user=None):
+    """
+    Approve the ticket requests of the queryset ``ticket_requests`` in one
+    transaction against a single quota snapshot. Requests that no longer fit
+    into the quota are left pending. Returns the approved requests.
+    """
+    approved = []
+
+    with transaction.atomic():
+        snapshot = QuotaSnapshot(event=event, quota=quota)
+        try:
+            for ticket_request in ticket_requests.select_for_update():
+                ticket_request.event = event
+                try:
+                    result = ticket_request.approve(user=user, quota_cache=snapshot)
+                except QuotaExhausted:
+                    break
+                if result is not False:
+                    approved.append(ticket_request)
+        except BaseException:
+            snapshot.release()
+            raise
+    return approved
+
+
+class VoucherPool:
+    """
+    Unassigned vouchers created ahead of time for an event's ticket request
+    quota, so approving a request only has to claim and bind one of them.
+
+    Pool vouchers neither block the quota nor can be redeemed (their validity
+    ends at creation) until they are claimed. They carry their own tag and a
+    comment saying so, which lets organizers filter them out of pretix'
+    voucher list, and the pool only holds vouchers while there is a backlog
+    of pending requests for the configured quota.
+    """
+    TAG = 'ticket-request-pool'
+    COMMENT = ugettext_noop('Reserved for approving ticket requests, not valid until assigned to one.')
+    MAX_SIZE = 200
+    BATCH_SIZE = 50
+
+    def __init__(self, *args, **kwargs):
+        self.event = kwargs.pop('event')
+        self.quota = kwargs.pop('quota')
+
+        super().__init__(*args, **kwargs)
+
+    def _unclaimed(self):
+        return Voucher.objects.filter(event=self.event, tag=self.TAG, redeemed=0)
+
+    def available(self):
+        return self._unclaimed().filter(quota=self.quota)
+
+    def target_size(self):
+        """
+        Size the pool from the pending backlog, capped at MAX_SIZE.
+        """
+        pending = self.event.ticket_requests.filter(status='pending').count()
+        return min(pending, self.MAX_SIZE)
+
+    def claim(self, comment, user=None):
+        """
+        Bind one pool voucher for use by a ticket request and return it, or
+        ``None`` if the pool is empty. Rows locked by concurrent claims are
+        skipped instead of waited on. Must be called inside a transaction.
+        """
+        voucher = self.available().select_for_update(skip_locked=True).order_by('pk').first()
+        if voucher is None:
+            return None
+
+        voucher.tag = 'ticket-request'
+        voucher.block_quota = True
+        voucher.valid_until = self.event.date_to
+        voucher.comment = comment
+        voucher.save(update_fields=['tag', 'block_quota', 'valid_until', 'comment'])
+        voucher.log_action('pretix.voucher.changed', {
+            'tag': voucher.tag,
+            'block_quota': voucher.block_quota,
+            'valid_until': voucher.valid_until.isoformat() if voucher.valid_until else None,
+        }, user=user)
+        return voucher
+
+    def prune(self):
+        """
+        Delete pool vouchers that are not for the pool's quota, e.g. since
+        the ticket request quota was changed, or that exceed its target size,
+        and return their number. Pass ``quota=None`` to empty the pool.
+        """
+        stale = self._unclaimed()
+        if self.quota is not None:
+            stale = stale.exclude(quota=self.quota)
+        surplus = self.available().count() - self.target_size() if self.quota is not None else 0
+
+        with transaction.atomic():
+            # Vouchers being claimed right now are left alone.
+            pks = list(stale.select_for_update(skip_locked=True).values_list('pk', flat=True))
+            if surplus > 0:
+                pks += list(
+                    self.available().select_for_update(skip_locked=True)
+                    .order_by('-pk').values_list('pk', flat=True)[:surplus]
+                )
+            Voucher.objects.filter(pk__in=pks).delete()
+
+        if pks:
+            self.event.log_action('pretix.ticket_request.voucher_pool.pruned', data={
+                'quota': self.quota.pk if self.quota is not None else None,
+                'count': len(pks),
+            })
+        return len(pks)
+
+    def refill(self):
+        """
+        Top the pool up to its target size in batches and return the number
+        of vouchers created.
+        """
+        missing = self.target_size() - self.available().count()
+        created = 0
+        while created < missing:
+            size = min(self.BATCH_SIZE, missing - created)
+            with transaction.atomic():
+                Voucher.objects.bulk_create([
+                    Voucher(
+                        event=self.event,
+                        quota=self.quota,
+                        max_usages=1,
+                        tag=self.TAG,
+                        comment=self.COMMENT,
+                        block_quota=False,
+                        valid_until=now(),
+                    )
+                    for __ in range(size)
+                ])
+            created += size
+
+        if created:
+            self.event.log_action('pretix.ticket_request.voucher_pool.refilled', data={
+                'quota': self.quota.pk,
+                'count': created,
+            })
+        return created
+
+
+class AutoApprover:
+    """
+    Approve pending ticket requests as long as the ticket request quota has
+    capacity, similar to pretix' waiting list.
+
+    Quota availability is computed at most once per run. If a run finds the
+    quota exhausted, that result is cached and the following runs skip the
+    quota computation until the cache expires.
+    """
+    ORDER_FIFO = 'fifo'
+    ORDER_PRIORITY = 'priority'
+    AVAILABILITY_CACHE_KEY = 'pretix_ticket_request_auto_approve_sold_out'
+    AVAILABILITY_CACHE_TTL = 300
+
+    def __init__(self, *args, **kwargs):
+        self.event = kwargs.pop('event')
+
+        super().__init__(*args, **kwargs)
+
+    def pending(self):
+        qs = self.event.ticket_requests.filter(status='pending', voucher__isnull=True)
+        if self.event.settings.ticket_request_auto_approve_order == self.ORDER_PRIORITY:
+            return qs.order_by('-priority', 'created_at', 'pk')
+        return qs.order_by('created_at', 'pk')
+
+    def run(self):
+        """
+        Approve the next pending requests that fit into the quota, up to the
+        configured per-run limit, and return the number of approved requests.
+        """
+        settings = self.event.settings
+        quota_id = settings.ticket_request_quota
+        if not settings.ticket_request_auto_approve or not quota_id:
+            return 0
+
+        cache = self.event.get_cache()
+        if cache.get(self.AVAILABILITY_CACHE_KEY):
+            return 0
+
+        quota = self.event.quotas.get(id=quota_id)
+        limit = settings.ticket_request_auto_approve_max_per_run
+        available = quota.availability()[1]
+        if available is not None:
+            limit = min(limit, available)
+
+        if limit <= 0:
+            cache.set(self.AVAILABILITY_CACHE_KEY, True, self.AVAILABILITY_CACHE_TTL)
+            return 0
+
+        return len(approve_many(self.event, quota, self.pending()[:limit]))
+
+
+class RequestSweeper:
+    """
+    Expire pending ticket requests and revoke unredeemed vouchers after the
+    deadlines configured for the event.
+
+    Rows are processed in chunks of CHUNK_SIZE, each in its own short
+    transaction, with bulk updates instead of per-row ``save()`` calls.
+    """
+    CHUNK_SIZE = 500
+
+    def __init__(self, *args, **kwargs):
+        self.event = kwargs.pop('event')
+
+        super().__init__(*args, **kwargs)
+
+    def run(self):
+        expired = self.expire_pending()
+        revoked = self.revoke_vouchers()
+
+        if expired or revoked:
+            from .reporting import invalidate_report
+
+            invalidate_report(self.event)
+        if revoked:
+            quota_id = self.event.settings.ticket_request_quota
+            if quota_id:
+                QuotaSnapshot.invalidate(self.event, quota_id)
+            self.event.get_cache().delete(AutoApprover.AVAILABILITY_CACHE_KEY)
+        return expired, revoked
+
+    def _chunks(self, qs):
+        while True:
+            with transaction.atomic():
+                pks = list(qs.select_for_update().values_list('pk', flat=True)[:self.CHUNK_SIZE])
+                if not pks:
+                    return
+                yield pks
+
+    def _log(self, model, pks, action_type):
+        content_type = ContentType.objects.get_for_model(model)
+        LogEntry.objects.bulk_create([
+            LogEntry(
+                content_type=content_type,
+                object_id=pk,
+                event=self.event,
+                action_type=action_type,
+                data=json.dumps({}),
+            )
+            for pk in pks
+        ])
+
+    def expire_pending(self):
+        days = self.event.settings.ticket_request_pending_expiry_days
+        if not days:
+            return 0
+
+        qs = self.event.ticket_requests.filter(
+            status='pending',
+            voucher__isnull=True,
+            created_at__lt=now() - timedelta(days=days),
+        ).order_by('pk')
+
+        count = 0
+        for pks in self._chunks(qs):
+            qs.model.objects.filter(pk__in=pks).update(status='rejected', updated_at=now())
+            self._log(qs.model, pks, 'pretix.ticket_request.expired')
+            count += len(pks)
+        return count
+
+    def revoke_vouchers(self):
+        days = self.event.settings.ticket_request_voucher_revoke_days
+        if not days:
+            return 0
+
+        qs = self.event.ticket_requests.filter(
+            status='approved',
+            approved_at__lt=now() - timedelta(days=days),
+            voucher__redeemed=0,
+        ).order_by('pk')
+
+        count = 0
+        for pks in self._chunks(qs):
+            voucher_ids = qs.model.objects.filter(pk__in=pks).values('voucher_id')
+            # Vouchers may have been redeemed since the chunk was selected.
+            # Locking them keeps orders from redeeming them until the chunk is
+            # committed, and only requests whose voucher was actually expired
+            # are withdrawn.
+            expired = list(
+                Voucher.objects.select_for_update()
+                .filter(pk__in=voucher_ids, redeemed=0)
+                .values_list('pk', flat=True)
+            )
+            # An expired voucher no longer counts against its quota, and keeping
+            # it preserves the audit trail between request and voucher.
+            Voucher.objects.filter(pk__in=expired).update(valid_until=now())
+            withdrawn = list(
+                qs.model.objects.filter(pk__in=pks, voucher_id__in=expired).values_list('pk', flat=True)
+            )
+            qs.model.objects.filter(pk__in=withdrawn).update(status='withdrawn', updated_at=now())
+            self._log(qs.model, withdrawn, 'pretix.ticket_request.voucher_revoked')
+            count += len(withdrawn)
+        return count
@@ -1,81 +1,280 @@
-from django.db.models import QuerySet
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.template.loader import get_template
-from django.urls import resolve, reverse
-from django.utils.translation import ugettext_lazy as _, get_language
-from i18nfield.strings import LazyI18nString
-from django.utils.functional import cached_property
+from django.urls import reverse
+from django.utils.translation import ugettext_lazy as _
+from django_scopes import scopes_disabled
+from pretix.base.models import Event, Voucher
+from pretix.base.settings import settings_hierarkey
+from django.utils.timezone import now
+from pretix.base.signals import (
+    order_canceled, order_expired, order_paid, order_placed, periodic_task, register_data_exporters,
+)
 from pretix.control.signals import nav_event
 from pretix.presale.signals import (checkout_flow_steps, front_page_bottom)
 
-from . import views
+from .archive import EventArchiver
+from .caching import FRAGMENT_TTL, front_page_key, increment_redeemed_count, nav_urls_key
+from .models import ArchiveChunk, Attendee, FunnelBucket, TicketRequest
+from .reporting import invalidate_report
+from .retention import RetentionEngine
+from .services import VoucherPool
+
+settings_hierarkey.add_default('ticket_request_auto_approve', 'False', bool)
+settings_hierarkey.add_default('ticket_request_auto_approve_order', 'fifo', str)
+settings_hierarkey.add_default('ticket_request_auto_approve_max_per_run', '50', int)
+settings_hierarkey.add_default('ticket_request_pending_expiry_days', '0', int)
+settings_hierarkey.add_default('ticket_request_voucher_revoke_days', '0', int)
+settings_hierarkey.add_default('ticket_request_archive_after_days', '0', int)
+settings_hierarkey.add_default('ticket_request_retention_days', '0', int)
+settings_hierarkey.add_default('ticket_request_retention_mode', 'anonymize', str)
+settings_hierarkey.add_default('ticket_request_retention_checkpoint', '{}', dict)
+settings_hierarkey.add_default('ticket_request_buffered_ingestion', 'False', bool)
+
+
+def _nav_urls(event):
+    cache = event.get_cache()
+    key = nav_urls_key(event)
+    urls = cache.get(key)
+    if urls is None:
+        url_kwargs = {
+            'event': event.slug,
+            'organizer': event.organizer.slug,
+        }
+        urls = {
+            name: reverse('plugins:pretix_ticket_request:{}'.format(name), kwargs=url_kwargs)
+            for name in ('list', 'settings', 'report', 'funnel', 'archive', 'attendee_list')
+        }
+        cache.set(key, urls, FRAGMENT_TTL)
+    return urls
 
 
 @receiver(nav_event, dispatch_uid='pretix_ticket_request_nav')
 def navbar_info(sender, request, **kwargs):
-    url = resolve(request.path_info)
+    urls = _nav_urls(request.event)
+    url = request.resolver_match
+    active = url.url_name if url and url.namespace == 'plugins:pretix_ticket_request' else None
     return [
         {
             'label': _('Ticket request'),
             'icon': 'flag',
-            'url': reverse(
-                'plugins:pretix_ticket_request:list',
-                kwargs={
-                    'event': request.event.slug,
-                    'organizer': request.organizer.slug,
-                },
-            ),
+            'url': urls['list'],
             'active': False,
             'children': [
                 {
                     'label': _('List'),
-                    'url': reverse(
-                        'plugins:pretix_ticket_request:list',
-                        kwargs={
-                            'event': request.event.slug,
-                            'organizer': request.organizer.slug,
-                        },
-                    ),
-                    'active': url.namespace == 'plugins:pretix_ticket_request' and url.url_name == 'list'
+                    'url': urls['list'],
+                    'active': active == 'list'
                 },
                 {
                     'label': _('Settings'),
-                    'url': reverse(
-                        'plugins:pretix_ticket_request:settings',
-                        kwargs={
-                            'event': request.event.slug,
-                            'organizer': request.organizer.slug,
-                        },
-                    ),
-                    'active': url.namespace == 'plugins:pretix_ticket_request' and url.url_name == 'settings'
+                    'url': urls['settings'],
+                    'active': active == 'settings'
+                },
+                {
+                    'label': _('Demographics'),
+                    'url': urls['report'],
+                    'active': active == 'report'
+                },
+                {
+                    'label': _('Funnel'),
+                    'url': urls['funnel'],
+                    'active': active == 'funnel'
+                },
+                {
+                    'label': _('Archive'),
+                    'url': urls['archive'],
+                    'active': active == 'archive'
                 },
             ]
         },
         {
             'label': _('Attendees'),
             'icon': 'user',
-            'url': reverse(
-                'plugins:pretix_ticket_request:attendee_list',
-                kwargs={
-                    'event': request.event.slug,
-                    'organizer': request.organizer.slug,
-                },
-            ),
-            'active': url.namespace == 'plugins:pretix_ticket_request' and url.url_name == 'attendee_list'
+            'url': urls['attendee_list'],
+            'active': active == 'attendee_list'
         },
     ]
 
 
 @receiver(checkout_flow_steps, dispatch_uid='pretix_ticket_request_verify_account_checkout_step')
 def verify_account_checkout_step(sender, **kwargs):
-    return views.VerifyAccountStep
+    # Views pull in pretix' presale views and checkout flow, which workers that
+    # never serve a checkout should not have to import at startup.
+    from .views import VerifyAccountStep
+    return VerifyAccountStep
 
 
 @receiver(checkout_flow_steps, dispatch_uid='pretix_ticket_request_your_profile_checkout_step')
 def your_profile_checkout_step(sender, **kwargs):
-    return views.AttendeeProfileStep
+    from .views import AttendeeProfileStep
+    return AttendeeProfileStep
 
 
 @receiver(front_page_bottom, dispatch_uid="pretix_ticket_request_frontpage_link")
 def pretixpresale_front_page_bottom(sender, **kwargs):
-    return get_template('pretix_ticket_request/front_page.html').render({'event': sender, 'organizer': sender.organizer})
+    cache = sender.get_cache()
+    key = front_page_key(sender)
+    fragment = cache.get(key)
+    if fragment is None:
+        fragment = get_template('pretix_ticket_request/front_page.html').render({
+            'event': sender,
+            'organizer': sender.organizer,
+        })
+        cache.set(key, fragment, FRAGMENT_TTL)
+    return fragment
+
+
+@receiver(register_data_exporters, dispatch_uid='pretix_ticket_request_demographics_exporter')
+def register_demographics_exporter(sender, **kwargs):
+    from .exporters import DemographicsExporter
+    return DemographicsExporter
+
+
+@receiver(post_save, sender=TicketRequest, dispatch_uid='pretix_ticket_request_report_invalidate_tr_save')
+@receiver(post_delete, sender=TicketRequest, dispatch_uid='pretix_ticket_request_report_invalidate_tr_delete')
+@receiver(post_save, sender=Attendee, dispatch_uid='pretix_ticket_request_report_invalidate_attendee_save')
+@receiver(post_delete, sender=Attendee, dispatch_uid='pretix_ticket_request_report_invalidate_attendee_delete')
+def invalidate_report_on_write(sender, instance, **kwargs):
+    invalidate_report(instance.event)
+
+
+def _events_with_requests(*statuses):
+    with scopes_disabled():
+        return list(Event.objects.filter(
+            plugins__contains='pretix_ticket_request',
+            ticket_requests__status__in=statuses,
+        ).distinct().values_list('pk', flat=True))
+
+
+@receiver(periodic_task, dispatch_uid='pretix_ticket_request_refill_voucher_pools')
+def refill_voucher_pools(sender, **kwargs):
+    from .tasks import refill_voucher_pool
+
+    # Events without a backlog still get their leftover pool pruned.
+    with scopes_disabled():
+        pooled = set(Voucher.objects.filter(tag=VoucherPool.TAG, redeemed=0).values_list('event_id', flat=True))
+    for event_id in pooled.union(_events_with_requests(TicketRequest.STATUS_PENDING)):
+        refill_voucher_pool.apply_async(kwargs={'event': event_id})
+
+
+@receiver(periodic_task, dispatch_uid='pretix_ticket_request_auto_approve')
+def auto_approve(sender, **kwargs):
+    from .tasks import auto_approve_ticket_requests
+
+    for event_id in _events_with_requests(TicketRequest.STATUS_PENDING):
+        auto_approve_ticket_requests.apply_async(kwargs={'event': event_id})
+
+
+@receiver(periodic_task, dispatch_uid='pretix_ticket_request_sweep')
+def sweep(sender, **kwargs):
+    from .tasks import sweep_ticket_requests
+
+    for event_id in _events_with_requests(TicketRequest.STATUS_PENDING, TicketRequest.STATUS_APPROVED):
+        sweep_ticket_requests.apply_async(kwargs={'event': event_id})
+
+
+@receiver(periodic_task, dispatch_uid='pretix_ticket_request_drain_submissions')
+def drain_submissions(sender, **kwargs):
+    from .tasks import drain_pending_submissions
+
+    # Drains are scheduled on submission, this catches any that were lost.
+    with scopes_disabled():
+        event_ids = list(Event.objects.filter(
+            pending_submissions__isnull=False,
+        ).distinct().values_list('pk', flat=True))
+
+    for event_id in event_ids:
+        drain_pending_submissions.apply_async(kwargs={'event': event_id})
+
+
+@receiver(periodic_task, dispatch_uid='pretix_ticket_request_archive')
+def archive(sender, **kwargs):
+    from .tasks import archive_ticket_requests
+
+    # Only events that have ended and still have rows are candidates. Of
+    # those, only events that enabled archiving and are past its delay are
+    # queued.
+    with scopes_disabled():
+        events = Event.objects.filter(
+            Q(date_to__lt=now()) | Q(date_to__isnull=True, date_from__lt=now()),
+            plugins__contains='pretix_ticket_request',
+        ).annotate(
+            has_ticket_requests=Exists(TicketRequest.objects.filter(event=OuterRef('pk'))),
+            has_attendees=Exists(Attendee.objects.filter(event=OuterRef('pk'))),
+        ).filter(Q(has_ticket_requests=True) | Q(has_attendees=True))
+        event_ids = [event.pk for event in events if EventArchiver(event=event).is_due()]
+
+    for event_id in event_ids:
+        archive_ticket_requests.apply_async(kwargs={'event': event_id})
+
+
+@receiver(periodic_task, dispatch_uid='pretix_ticket_request_retention')
+def apply_retention(sender, **kwargs):
+    from .tasks import apply_ticket_request_retention
+
+    # Only ended events with rows left to process and a retention period
+    # that has passed are queued.
+    with scopes_disabled():
+        events = Event.objects.filter(
+            Q(date_to__lt=now()) | Q(date_to__isnull=True, date_from__lt=now()),
+            plugins__contains='pretix_ticket_request',
+        ).annotate(
+            has_ticket_requests=Exists(TicketRequest.objects.filter(event=OuterRef('pk'), anonymized_at__isnull=True)),
+            has_attendees=Exists(Attendee.objects.filter(event=OuterRef('pk'), anonymized_at__isnull=True)),
+            has_archive=Exists(ArchiveChunk.objects.filter(event=OuterRef('pk'), anonymized_at__isnull=True)),
+        ).filter(Q(has_ticket_requests=True) | Q(has_attendees=True) | Q(has_archive=True))
+        event_ids = [event.pk for event in events if RetentionEngine(event=event).is_due()]
+
+    for event_id in event_ids:
+        apply_ticket_request_retention.apply_async(kwargs={'event': event_id})
+
+
+@receiver(order_placed, dispatch_uid='pretix_ticket_request_order_placed')
+@receiver(order_paid, dispatch_uid='pretix_ticket_request_order_paid')
+def track_redemption(sender, order, **kwargs):
+    voucher_ids = order.positions.filter(voucher__isnull=False).values('voucher_id')
+    # The voucher foreign key is indexed, so this is a single indexed update
+    # no matter how many requests the event has.
+    redeemed = TicketRequest.objects.filter(
+        event=sender,
+        voucher_id__in=voucher_ids,
+        redeemed_at__isnull=True,
+    ).update(redeemed_at=now(), updated_at=now())
+
+    if redeemed:
+        FunnelBucket.bump(sender, 'redeemed', redeemed)
+        increment_redeemed_count(sender, redeemed)
+        invalidate_report(sender)
+
+
+@receiver(order_canceled, dispatch_uid='pretix_ticket_request_order_canceled')
+@receiver(order_expired, dispatch_uid='pretix_ticket_request_order_expired')
+def untrack_redemption(sender, order, **kwargs):
+    # Canceled positions are excluded from order.positions.
+    voucher_ids = order.all_positions.filter(voucher__isnull=False).values('voucher_id')
+    with transaction.atomic():
+        # pretix has given the voucher back by now, so it may be redeemed in
+        # another order. Requests whose voucher is still in use stay redeemed.
+        redeemed = list(TicketRequest.objects.filter(
+            event=sender,
+            voucher_id__in=voucher_ids,
+            voucher__redeemed=0,
+            redeemed_at__isnull=False,
+        ).select_for_update().values_list('pk', 'redeemed_at'))
+        if not redeemed:
+            return
+
+        TicketRequest.objects.filter(pk__in=[pk for pk, __ in redeemed]).update(redeemed_at=None, updated_at=now())
+        # Redemptions were counted in the funnel bucket of the day they
+        # happened.
+        dates = Counter(redeemed_at.astimezone(sender.timezone).date() for __, redeemed_at in redeemed)
+        for date, count in dates.items():
+            FunnelBucket.revert(sender, 'redeemed', date, count)
+
+    increment_redeemed_count(sender, -len(redeemed))
+    invalidate_report(sender)
@@ -0,0 +1,81 @@
+/*
+ * Approve and reject ticket requests from the list without reloading it.
+ * The server answers with the new state of the row, which is patched in
+ * place. Without JavaScript, the links fall back to the full page views.
+ */
+(function () {
+    'use strict';
+
+    var csrfInput = document.querySelector('input[name="csrfmiddlewaretoken"]');
+    var remaining = document.getElementById('ticket-request-quota-remaining');
+
+    function updateRow(row, state) {
+        row.querySelector('.ticket-request-status').innerHTML = state.status_html;
+        if (state.status !== 'pending') {
+            row.querySelector('.ticket-request-select').innerHTML = '';
+            row.querySelector('.ticket-request-actions').innerHTML = '';
+        }
+
+        var voucher = row.querySelector('.ticket-request-voucher');
+        voucher.innerHTML = '';
+        if (state.voucher_code) {
+            var link = document.createElement('a');
+            link.href = state.voucher_url;
+            link.textContent = state.voucher_code;
+            var strong = document.createElement('strong');
+            strong.appendChild(link);
+            voucher.appendChild(strong);
+        }
+
+        if (remaining && state.quota_remaining !== null) {
+            remaining.textContent = state.quota_remaining;
+        }
+    }
+
+    document.addEventListener('click', function (e) {
+        var button = e.target.closest('a[data-ticket-request-action]');
+        if (!button) {
+            return;
+        }
+        e.preventDefault();
+        if (button.classList.contains('disabled')) {
+            return;
+        }
+
+        var row = button.closest('tr[data-ticket-request]');
+        var buttons = row.querySelectorAll('a[data-ticket-request-action]');
+        for (var i = 0; i < buttons.length; i++) {
+            buttons[i].classList.add('disabled');
+        }
+
+        var xhr = new XMLHttpRequest();
+        xhr.open('POST', button.getAttribute('data-ticket-request-action'));
+        xhr.setRequestHeader('X-CSRFToken', csrfInput.value);
+        xhr.setRequestHeader('X-Requested-With', 'XMLHttpRequest');
+        xhr.onload = function () {
+            var state = null;
+            try {
+                state = JSON.parse(xhr.responseText);
+            } catch (err) {
+                // Not a row state, e.g. an error page.
+            }
+            if (!state) {
+                // The action may or may not have been applied, so show the
+                // list as it is now instead of repeating the action.
+                window.location.reload();
+                return;
+            }
+            updateRow(row, state);
+            for (var i = 0; i < buttons.length; i++) {
+                buttons[i].classList.remove('disabled');
+            }
+            if (state.error) {
+                window.alert(state.error);
+            }
+        };
+        xhr.onerror = function () {
+            window.location.reload();
+        };
+        xhr.send();
+    });
+}());
@@ -0,0 +1,44 @@
+/*
+ * Visitors without cookies get a ticket request page that shared caches may
+ * serve to everyone, so it cannot contain a CSRF token. Copy the token from
+ * the CSRF cookie into the form, asking the server to set the cookie first if
+ * it is missing.
+ */
+(function () {
+    'use strict';
+
+    var inputs = document.querySelectorAll('input[data-ticket-request-csrf]');
+    if (!inputs.length) {
+        return;
+    }
+    var cookieName = inputs[0].getAttribute('data-cookie-name');
+
+    function readCookie() {
+        var cookies = document.cookie ? document.cookie.split(';') : [];
+        for (var i = 0; i < cookies.length; i++) {
+            var cookie = cookies[i].trim();
+            if (cookie.substring(0, cookieName.length + 1) === cookieName + '=') {
+                return decodeURIComponent(cookie.substring(cookieName.length + 1));
+            }
+        }
+        return null;
+    }
+
+    function fill(token) {
+        for (var i = 0; i < inputs.length; i++) {
+            inputs[i].value = token;
+        }
+    }
+
+    var token = readCookie();
+    if (token) {
+        fill(token);
+        return;
+    }
+    var xhr = new XMLHttpRequest();
+    xhr.open('GET', inputs[0].getAttribute('data-cookie-url'));
+    xhr.onload = function () {
+        fill(readCookie() || '');
+    };
+    xhr.send();
+}());
@@ -0,0 +1,80 @@
+from django.core.cache import cache
+from django.db import transaction
+from pretix.base.models import Event
+from pretix.base.services.tasks import EventTask
+from pretix.celery_app import app
+
+from .archive import EventArchiver
+from .ingestion import SubmissionDrainer
+from .retention import RetentionEngine
+from .services import AutoApprover, RequestSweeper, VoucherPool
+
+REFILL_LOCK_KEY = 'pretix_ticket_request_pool_refill_{}'
+REFILL_LOCK_TIMEOUT = 60
+DRAIN_LOCK_KEY = 'pretix_ticket_request_submission_drain_{}'
+DRAIN_DELAY = 5
+
+
+@app.task(base=EventTask)
+def refill_voucher_pool(event: Event):
+    quota_id = event.settings.ticket_request_quota
+    quota = event.quotas.filter(id=quota_id).first() if quota_id else None
+    pool = VoucherPool(event=event, quota=quota)
+    pool.prune()
+    if quota:
+        pool.refill()
+
+
+def schedule_voucher_pool_refill(event):
+    """
+    Queue a pool refill once the current transaction commits. Refills
+    requested within REFILL_LOCK_TIMEOUT of each other are coalesced.
+    """
+    def schedule():
+        # Taking the lock only after the commit keeps a rolled back approval
+        # from suppressing the refills of the following ones.
+        if cache.add(REFILL_LOCK_KEY.format(event.pk), True, REFILL_LOCK_TIMEOUT):
+            refill_voucher_pool.apply_async(kwargs={'event': event.pk})
+
+    transaction.on_commit(schedule)
+
+
+@app.task(base=EventTask)
+def auto_approve_ticket_requests(event: Event):
+    AutoApprover(event=event).run()
+
+
+@app.task(base=EventTask)
+def sweep_ticket_requests(event: Event):
+    RequestSweeper(event=event).run()
+
+
+@app.task(base=EventTask)
+def archive_ticket_requests(event: Event):
+    archiver = EventArchiver(event=event)
+    if archiver.is_due():
+        archiver.run()
+
+
+@app.task(base=EventTask)
+def apply_ticket_request_retention(event: Event):
+    engine = RetentionEngine(event=event)
+    if engine.is_due():
+        engine.run()
+
+
+@app.task(base=EventTask)
+def drain_pending_submissions(event: Event):
+    SubmissionDrainer(event=event).run()
+
+
+def schedule_submission_drain(event):
+    """
+    Queue a drain of staged submissions DRAIN_DELAY seconds after the current
+    transaction commits, so submissions arriving in the meantime are inserted
+    in the same batch.
+    """
+    if cache.add(DRAIN_LOCK_KEY.format(event.pk), True, DRAIN_DELAY):
+        transaction.on_commit(
+            lambda: drain_pending_submissions.apply_async(kwargs={'event': event.pk}, countdown=DRAIN_DELAY)
+        )
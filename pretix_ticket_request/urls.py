@@ -13,6 +13,26 @@ urlpatterns = [
         views.TicketRequestList.as_view(),
         name='list',
     ),
+    url(
+        r'^control/event/(?P<organizer>[^/]+)/(?P<event>[^/]+)/ticket-request/approve$',
+        views.approve_selected,
+        name='approve_selected',
+    ),
+    url(
+        r'^control/event/(?P<organizer>[^/]+)/(?P<event>[^/]+)/ticket-request/funnel/$',
+        views.TicketRequestFunnel.as_view(),
+        name='funnel',
+    ),
+    url(
+        r'^control/event/(?P<organizer>[^/]+)/(?P<event>[^/]+)/ticket-request/archive/$',
+        views.TicketRequestArchive.as_view(),
+        name='archive',
+    ),
+    url(
+        r'^control/event/(?P<organizer>[^/]+)/(?P<event>[^/]+)/ticket-request/report/$',
+        views.TicketRequestReport.as_view(),
+        name='report',
+    ),
     url(
         r'^control/event/(?P<organizer>[^/]+)/(?P<event>[^/]+)/ticket-request/(?P<ticket_request>\d+)/$',
         views.TicketRequestUpdate.as_view(),
@@ -28,6 +48,16 @@ urlpatterns = [
         views.reject,
         name='reject',
     ),
+    url(
+        r'^control/event/(?P<organizer>[^/]+)/(?P<event>[^/]+)/ticket-request/(?P<ticket_request>\d+)/approve\.json$',
+        views.approve_json,
+        name='approve_json',
+    ),
+    url(
+        r'^control/event/(?P<organizer>[^/]+)/(?P<event>[^/]+)/ticket-request/(?P<ticket_request>\d+)/reject\.json$',
+        views.reject_json,
+        name='reject_json',
+    ),
     url(
         r'^control/event/(?P<organizer>[^/]+)/(?P<event>[^/]+)/attendees/$',
         views.AttendeeList.as_view(),
@@ -38,8 +68,14 @@ urlpatterns = [
         views.AttendeeDetail.as_view(),
         name='attendee_detail',
     ),
+    url(
+        r'^ticket-request/metrics$',
+        views.metrics,
+        name='metrics',
+    ),
 ]
 
 event_patterns = [
     url(r'^ticket-request/$', views.TicketRequestCreate.as_view(), name='request'),
+    url(r'^ticket-request/csrf$', views.request_csrf, name='request_csrf'),
 ]
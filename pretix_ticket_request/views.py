@@ -1,16 +1,24 @@
-import pytz
+import base64
+import hmac
 
 from decimal import Decimal
+from django.conf import settings
 from django import forms
 from django.contrib import messages
-from django.http import Http404
+from django.core.paginator import Paginator
+from django.http import Http404, HttpResponse, JsonResponse
 from django.shortcuts import redirect
+from django.template.loader import render_to_string
 from django.core.validators import EmailValidator
 from django.urls import resolve, reverse
 from django.utils.translation import ugettext_lazy as _
+from django.utils.cache import patch_cache_control, patch_vary_headers
 from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import ensure_csrf_cookie
+from django.views.decorators.http import require_GET, require_POST
 from django.views.generic import (TemplateView, ListView, FormView, UpdateView)
 from django.db import transaction
+from django.db.models import Sum
 from django.utils.functional import cached_property
 
 from pretix.base.models import (Event, Item, Question)
@@ -25,9 +33,14 @@ from pretix.presale.views import CartMixin
 from pretix.presale.checkoutflow import TemplateFlowStep
 
 from . import forms
-from .services import VerificationCodeMailer
-from .models import (TicketRequest, Attendee)
-from .filter import TicketRequestSearchFilterForm
+from .caching import REQUEST_PAGE_MAX_AGE, redeemed_count, settings_version
+from .metrics import instrumented, render_metrics
+from .projections import AttendeeRow, TicketRequestRow, attendee_rows, ticket_request_rows
+from .services import QuotaExhausted, QuotaSnapshot, VerificationCodeMailer, approve_many
+from .models import (ArchiveChunk, Attendee, FunnelBucket, TicketRequest)
+from .reporting import CROSSTABS, DIMENSIONS, crosstab_header, crosstab_rows, get_report, invalidate_report
+from .routing import mark_written, read_database
+from .filter import AttendeeFilterForm, TicketRequestSearchFilterForm
 
 
 class TicketRequestSettings(EventSettingsViewMixin, EventSettingsFormView):
@@ -59,26 +72,139 @@ class TicketRequestList(EventPermissionRequiredMixin, PaginationMixin, ListView)
     permission = 'can_change_event_settings'
 
     def get_queryset(self):
-        qs = TicketRequest.objects.filter(
+        qs = TicketRequest.objects.using(read_database(self.request)).filter(
             event=self.request.event
-        ).select_related('voucher')
+        )
 
         if self.filter_form.is_valid():
             qs = self.filter_form.filter_qs(qs)
 
-        return qs
+        return ticket_request_rows(qs)
+
+    @instrumented('ticket_request_list')
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs).render()
 
     @cached_property
     def filter_form(self):
         return TicketRequestSearchFilterForm(request=self.request, data=self.request.GET)
 
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        url_kwargs = {
+            'organizer': self.request.event.organizer.slug,
+            'event': self.request.event.slug,
+        }
+        # Row links are built from these prefixes instead of reversing
+        # every URL once per row.
+        ctx['ticket_requests'] = [TicketRequestRow.from_values(row) for row in ctx['ticket_requests']]
+        ctx['base_url'] = reverse('plugins:pretix_ticket_request:list', kwargs=url_kwargs)
+        ctx['voucher_base_url'] = reverse('control:event.vouchers', kwargs=url_kwargs)
+        ctx['quota_snapshot'] = self.quota_snapshot
+        ctx['redeemed_count'] = redeemed_count(self.request.event)
+        ctx['filter_form'] = self.filter_form
+        return ctx
+
+    @cached_property
+    def quota_snapshot(self):
+        return _quota_snapshot(self.request.event)
+
+
+def _quota_snapshot(event):
+    quota_id = event.settings.ticket_request_quota
+    quota = event.quotas.filter(id=quota_id).first() if quota_id else None
+    if quota:
+        return QuotaSnapshot(event=event, quota=quota)
+
+
+class TicketRequestReport(EventPermissionRequiredMixin, TemplateView):
+    template_name = 'pretix_ticket_request/report.html'
+    permission = 'can_change_event_settings'
+
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        report = get_report(self.request.event, using=read_database(self.request))
+        ctx['crosstabs'] = [
+            {
+                'title': ' × '.join(str(DIMENSIONS[d][0]) for d in dims),
+                'header': crosstab_header(name),
+                'rows': list(crosstab_rows(report, name)),
+            }
+            for name, dims in CROSSTABS.items()
+        ]
+        return ctx
+
+
+class TicketRequestFunnel(EventPermissionRequiredMixin, TemplateView):
+    template_name = 'pretix_ticket_request/funnel.html'
+    permission = 'can_change_event_settings'
+
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        buckets = FunnelBucket.objects.using(read_database(self.request)).filter(event=self.request.event)
+        ctx['buckets'] = buckets
+        ctx['totals'] = buckets.aggregate(**{stage: Sum(stage) for stage in FunnelBucket.STAGES})
+        return ctx
+
+
+class TicketRequestArchive(EventPermissionRequiredMixin, TemplateView):
+    template_name = 'pretix_ticket_request/archive.html'
+    permission = 'can_change_event_settings'
+
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        kind = self.request.GET.get('kind')
+        if kind not in dict(ArchiveChunk.KIND_CHOICES):
+            kind = ArchiveChunk.KIND_TICKET_REQUEST
+
+        # Each page is one archived chunk, so only its payload is loaded and
+        # decompressed.
+        chunks = ArchiveChunk.objects.using(read_database(self.request)).filter(event=self.request.event, kind=kind)
+        paginator = Paginator(chunks.defer('payload'), 1)
+        page = paginator.get_page(self.request.GET.get('page'))
+        ctx['kind'] = kind
+        ctx['kinds'] = ArchiveChunk.KIND_CHOICES
+        ctx['page_obj'] = page
+        ctx['paginator'] = paginator
+        ctx['is_paginated'] = paginator.num_pages > 1
+        ctx['records'] = chunks.get(pk=page.object_list[0].pk).records() if paginator.count else []
+        return ctx
+
 
 @event_permission_required("can_change_event_settings")
 def approve(request, organizer, event, ticket_request):
     ticket_request = request.event.ticket_requests.get(id=ticket_request)
-    ticket_request.approve(user=request.user)
+    try:
+        ticket_request.approve(user=request.user)
+    except QuotaExhausted as e:
+        messages.error(request, str(e))
+    else:
+        mark_written(request)
+        messages.success(request, _('Ticket has been approved.'))
+    return redirect('plugins:pretix_ticket_request:list',
+                    organizer=request.event.organizer.slug,
+                    event=request.event.slug)
 
-    messages.success(request, _('Ticket has been approved.'))
+
+@require_POST
+@event_permission_required("can_change_event_settings")
+def approve_selected(request, organizer, event):
+    quota_id = request.event.settings.ticket_request_quota
+    if not quota_id:
+        messages.error(request, _('Please select a ticket quota in the settings first.'))
+    else:
+        selected = request.event.ticket_requests.filter(
+            id__in=request.POST.getlist('ticket_request'),
+            status=TicketRequest.STATUS_PENDING,
+        ).order_by('created_at', 'pk')
+        approved = approve_many(request.event, request.event.quotas.get(id=quota_id), selected, user=request.user)
+        skipped = len(request.POST.getlist('ticket_request')) - len(approved)
+        mark_written(request)
+
+        messages.success(request, _('{count} tickets have been approved.').format(count=len(approved)))
+        if skipped:
+            messages.warning(request, _('{count} requests were not approved because they are not pending '
+                                        'or the quota has no capacity left.').format(count=skipped))
     return redirect('plugins:pretix_ticket_request:list',
                     organizer=request.event.organizer.slug,
                     event=request.event.slug)
@@ -88,6 +214,7 @@ def approve(request, organizer, event, ticket_request):
 def reject(request, organizer, event, ticket_request):
     ticket_request = request.event.ticket_requests.get(id=ticket_request)
     ticket_request.reject(user=request.user)
+    mark_written(request)
 
     messages.success(request, _('Ticket has been rejected.'))
     return redirect('plugins:pretix_ticket_request:list',
@@ -95,6 +222,88 @@ def reject(request, organizer, event, ticket_request):
                     event=request.event.slug)
 
 
+def _row_state(request, ticket_request, error=None):
+    """
+    The parts of a list row that change with a decision, for the list to
+    update the row in place instead of reloading the page.
+    """
+    snapshot = _quota_snapshot(request.event)
+    voucher = ticket_request.voucher
+    return JsonResponse({
+        'id': ticket_request.pk,
+        'status': ticket_request.status,
+        'status_html': render_to_string('pretix_ticket_request/fragment_status.html', {
+            'status': ticket_request.status,
+            'ticket_request': ticket_request,
+        }),
+        'voucher_code': voucher.code if voucher else None,
+        'voucher_url': reverse('control:event.voucher', kwargs={
+            'organizer': request.event.organizer.slug,
+            'event': request.event.slug,
+            'voucher': voucher.pk,
+        }) if voucher else None,
+        'quota_remaining': (None if snapshot.unlimited else snapshot.remaining) if snapshot else None,
+        'error': error,
+    }, status=409 if error else 200)
+
+
+@require_POST
+@event_permission_required("can_change_event_settings")
+def approve_json(request, organizer, event, ticket_request):
+    ticket_request = request.event.ticket_requests.select_related('voucher').get(id=ticket_request)
+    try:
+        ticket_request.approve(user=request.user)
+    except QuotaExhausted as e:
+        # The approval was rolled back, but not the status set on the instance.
+        ticket_request.refresh_from_db()
+        return _row_state(request, ticket_request, error=str(e))
+    mark_written(request)
+    return _row_state(request, ticket_request)
+
+
+@require_POST
+@event_permission_required("can_change_event_settings")
+def reject_json(request, organizer, event, ticket_request):
+    ticket_request = request.event.ticket_requests.select_related('voucher').get(id=ticket_request)
+    ticket_request.reject(user=request.user)
+    mark_written(request)
+    return _row_state(request, ticket_request)
+
+
+def _metrics_unauthorized():
+    response = HttpResponse(_('You are not authorized to view this page.'), content_type='text/plain', status=401)
+    response['WWW-Authenticate'] = 'Basic realm="metrics"'
+    return response
+
+
+def metrics(request):
+    """
+    Prometheus metrics for the plugin. Accessible with the credentials of
+    pretix' own metrics endpoint or from an active staff session.
+    """
+    user = getattr(request, 'user', None)
+    if user and user.is_authenticated and user.has_active_staff_session(request.session.session_key):
+        return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4')
+
+    if not getattr(settings, 'METRICS_ENABLED', False):
+        return _metrics_unauthorized()
+
+    method, __, credentials = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+    if method.lower() != 'basic':
+        return _metrics_unauthorized()
+
+    try:
+        username, __, passphrase = base64.b64decode(credentials.strip()).decode().partition(':')
+    except ValueError:
+        return _metrics_unauthorized()
+
+    if not hmac.compare_digest(username, settings.METRICS_USER) or \
+            not hmac.compare_digest(passphrase, settings.METRICS_PASSPHRASE):
+        return _metrics_unauthorized()
+
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4')
+
+
 class TicketRequestDetailMixin:
     def get_object(self, queryset=None):
         url = resolve(self.request.path_info)
@@ -124,6 +333,7 @@ class TicketRequestUpdate(EventPermissionRequiredMixin, TicketRequestDetailMixin
     def form_valid(self, form):
         messages.success(self.request, _('Your changes have been saved.'))
         if form.has_changed():
+            mark_written(self.request)
             self.object.log_action(
                 'pretix.ticket_request.changed', user=self.request.user, data={
                     k: form.cleaned_data.get(k) for k in form.changed_data
@@ -150,8 +360,51 @@ class TicketRequestCreate(FormView):
             },
         )
 
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        ctx['csrf_cookie_name'] = settings.CSRF_COOKIE_NAME
+        ctx['settings_version'] = settings_version(self.request.event)
+        # Only pages that shared caches may store go without a CSRF token.
+        ctx['shareable'] = self._shareable()
+        return ctx
+
+    def _shareable(self):
+        return self.request.method == 'GET' and not self.request.COOKIES
+
+    def get(self, request, *args, **kwargs):
+        """
+        The empty form looks the same for every visitor, so its fields are
+        rendered once per event, locale and plugin settings version and
+        served from the template fragment cache. The rest of the page, which
+        shows the event and its presale state, is rendered on every request.
+
+        Responses to visitors without cookies are public, so a reverse proxy
+        can absorb the launch spike as well. They carry no CSRF token, which
+        request_form.js fills in from the cookie. Any cookie may carry a
+        language choice, a session or messages, so those responses are
+        private and contain the token like any other form.
+        """
+        response = super().get(request, *args, **kwargs)
+        response.render()
+        if self._shareable() and not response.cookies and not request.META.get('CSRF_COOKIE_USED'):
+            patch_cache_control(response, public=True, max_age=REQUEST_PAGE_MAX_AGE)
+            patch_vary_headers(response, ('Accept-Language', 'Cookie'))
+        else:
+            patch_cache_control(response, private=True, max_age=0)
+        return response
+
+    @instrumented('request_create')
     @transaction.atomic
     def form_valid(self, form):
+        if self.request.event.settings.ticket_request_buffered_ingestion:
+            from .tasks import schedule_submission_drain
+
+            form.enqueue()
+            schedule_submission_drain(self.request.event)
+            messages.success(self.request, _('Your request has been received. A confirmation email will be sent '
+                                             'shortly.'))
+            return super().form_valid(form)
+
         form.instance.event = self.request.event
         form.save()
 
@@ -160,6 +413,18 @@ class TicketRequestCreate(FormView):
         return super().form_valid(form)
 
 
+@require_GET
+@ensure_csrf_cookie
+def request_csrf(request, *args, **kwargs):
+    """
+    Set the CSRF cookie for visitors that were served the cached request page
+    before they had one.
+    """
+    response = HttpResponse(status=204)
+    patch_cache_control(response, private=True, no_store=True)
+    return response
+
+
 class AttendeeList(EventPermissionRequiredMixin, PaginationMixin, ListView):
     model = Attendee
     context_object_name = 'attendees'
@@ -168,10 +433,35 @@ class AttendeeList(EventPermissionRequiredMixin, PaginationMixin, ListView):
     permission = 'can_change_event_settings'
 
     def get_queryset(self):
-        qs = Attendee.objects.filter(
+        qs = Attendee.objects.using(read_database(self.request)).filter(
             event=self.request.event
         )
-        return qs
+
+        if self.filter_form.is_valid():
+            qs = self.filter_form.filter_qs(qs)
+
+        return attendee_rows(qs)
+
+    @instrumented('attendee_list')
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs).render()
+
+    @cached_property
+    def filter_form(self):
+        return AttendeeFilterForm(request=self.request, data=self.request.GET)
+
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        ctx['attendees'] = [AttendeeRow(*row) for row in ctx['attendees']]
+        ctx['base_url'] = reverse(
+            'plugins:pretix_ticket_request:attendee_list',
+            kwargs={
+                'organizer': self.request.event.organizer.slug,
+                'event': self.request.event.slug,
+            },
+        )
+        ctx['filter_form'] = self.filter_form
+        return ctx
 
 
 class AttendeeDetailMixin:
@@ -203,6 +493,7 @@ class AttendeeDetail(EventPermissionRequiredMixin, AttendeeDetailMixin, UpdateVi
     def form_valid(self, form):
         messages.success(self.request, _('Your changes have been saved.'))
         if form.has_changed():
+            mark_written(self.request)
             self.object.log_action(
                 'pretix.attendee_profile.changed', user=self.request.user, data={
                     k: form.cleaned_data.get(k) for k in form.changed_data
@@ -226,6 +517,7 @@ class VerifyAccountStep(CartMixin, TemplateFlowStep):
 
         return self.cart_session['verification_code_matches']
 
+    @instrumented('verify_account_get')
     def get(self, request):
         self.request = request
         event = self.request.event
@@ -253,6 +545,7 @@ class VerifyAccountStep(CartMixin, TemplateFlowStep):
 
         return self.render()
 
+    @instrumented('verify_account_post')
     def post(self, request):
         self.request = request
         event = self.request.event
@@ -273,15 +566,18 @@ class VerifyAccountStep(CartMixin, TemplateFlowStep):
 
         # create Attendee
         # at this point we know this user has access to email
-        attendee, created = self.request.event.attendees.get_or_create(email=email)
+        attendee_id, created = Attendee.upsert_verified(event, email)
 
-        if created:
-            attendee.verified = True
+        if attendee_id is None:
+            messages.error(request, _('This email address has already been registered for another event.'))
+            return self.render()
 
-        attendee.save()
+        if created:
+            FunnelBucket.bump(event, 'verified')
+            invalidate_report(event)
 
         self.cart_session['verification_code_matches'] = True
-        self.cart_session['attendee_id'] = attendee.id
+        self.cart_session['attendee_id'] = attendee_id
 
         return redirect(self.get_next_url(request))
 
@@ -328,6 +624,11 @@ class AttendeeProfileStep(CartMixin, TemplateFlowStep):
 
         return True
 
+    @instrumented('profile_get')
+    def get(self, request):
+        return super().get(request)
+
+    @instrumented('profile_post')
     def post(self, request):
         self.request = request
         event = self.request.event
@@ -335,8 +636,12 @@ class AttendeeProfileStep(CartMixin, TemplateFlowStep):
         if not self.form.is_valid():
             return self.render()
 
+        had_profile = self.attendee.has_profile()
         attendee = self.form.save()
 
+        if not had_profile:
+            FunnelBucket.bump(event, 'profiled')
+
         # go to next step
         return redirect(self.get_next_url(request))
 
@@ -345,8 +650,7 @@ class AttendeeProfileStep(CartMixin, TemplateFlowStep):
         attendee_id = self.cart_session['attendee_id']
         self.attendee = self.request.event.attendees.get(id=attendee_id)
 
-        initial = self.attendee.profile
-        initial['email'] = self.attendee.email
+        initial = dict(self.attendee.profile, email=self.attendee.email)
 
         f = forms.AttendeeProfileForm(data=self.request.POST if self.request.method == "POST" else None,
                                       attendee=self.attendee, initial=initial)
@@ -0,0 +1,61 @@
+"""
+Rendering cost of the control panel list of ticket requests at 20, 200 and
+1000 rows per page, with a cold and a warm row fragment cache.
+
+Run with ``python -m pytest tests/benchmarks/bench_list.py -s``.
+"""
+import pytest
+from django.core.cache import cache
+from django.urls import reverse
+from pretix.base.models import Team, User, Voucher
+
+from pretix_ticket_request.models import TicketRequest
+from pretix_ticket_request.views import TicketRequestList
+
+COUNTRIES = ('DE', 'US', 'BR', 'KE', 'IN', 'MX')
+
+
+@pytest.fixture
+def admin_client(client, event):
+    user = User.objects.create_user('admin@example.org', 'admin')
+    team = Team.objects.create(organizer=event.organizer, all_events=True, can_change_event_settings=True)
+    team.members.add(user)
+    client.login(email='admin@example.org', password='admin')
+    return client
+
+
+def _create_ticket_requests(event, count):
+    vouchers = Voucher.objects.bulk_create([
+        Voucher(event=event, code='BENCH{:05d}'.format(i), max_usages=1, tag='ticket-request')
+        for i in range(0, count, 3)
+    ])
+    TicketRequest.objects.bulk_create([
+        TicketRequest(
+            event=event,
+            name='Requester {}'.format(i),
+            email='requester{}@example.org'.format(i),
+            status=TicketRequest.STATUS_APPROVED if i % 3 == 0 else TicketRequest.STATUS_PENDING,
+            voucher=vouchers[i // 3] if i % 3 == 0 else None,
+            data={'country': COUNTRIES[i % len(COUNTRIES)]},
+        )
+        for i in range(count)
+    ])
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('rows', (20, 200, 1000))
+def test_ticket_request_list(bench, admin_client, event, locmem_cache, monkeypatch, rows):
+    _create_ticket_requests(event, rows)
+    monkeypatch.setattr(TicketRequestList, 'get_paginate_by', lambda self, queryset: rows)
+    url = reverse('plugins:pretix_ticket_request:list', kwargs={'organizer': event.organizer.slug, 'event': event.slug})
+
+    def cold():
+        cache.clear()
+        # Fails instead of timing a login redirect should the session be lost.
+        assert admin_client.get(url).status_code == 200
+
+    response = admin_client.get(url)
+    assert response.status_code == 200
+    assert response.content.count(b'requester') >= rows
+    bench('{:>4} rows, cold row cache'.format(rows), cold, number=5)
+    bench('{:>4} rows, cached rows'.format(rows), lambda: admin_client.get(url), number=5)
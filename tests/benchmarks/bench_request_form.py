@@ -0,0 +1,46 @@
+"""
+Rendering cost of the public ticket request form, the page that takes the
+full burst of applicants when requests open.
+
+Run with ``python -m pytest tests/benchmarks/bench_request_form.py -s``.
+"""
+import pytest
+from django.core.cache import cache
+from django.utils.translation import override
+from django_countries import Countries
+from pretix.multidomain.urlreverse import eventreverse
+
+from pretix_ticket_request.forms import TicketRequestForm, country_choices
+
+
+@pytest.fixture
+def live_event(event):
+    event.live = True
+    event.save()
+    return event
+
+
+@pytest.mark.django_db
+def test_country_choices(bench):
+    with override('de'):
+        bench('country choices, Countries() per form', lambda: list(Countries()))
+        bench('country choices, cached per locale', country_choices)
+
+
+@pytest.mark.django_db
+def test_form_instantiation(bench, event):
+    with override('de'):
+        bench('instantiate TicketRequestForm', lambda: TicketRequestForm(event=event))
+
+
+@pytest.mark.django_db
+def test_request_page(bench, client, live_event, locmem_cache):
+    url = eventreverse(live_event, 'plugins:pretix_ticket_request:request')
+
+    def cold():
+        cache.clear()
+        return client.get(url)
+
+    assert client.get(url).status_code == 200
+    bench('GET request page, cold fragment cache', cold, number=20)
+    bench('GET request page, cached form fragment', lambda: client.get(url), number=20)
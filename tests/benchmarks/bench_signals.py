@@ -0,0 +1,58 @@
+"""
+Per-request overhead of the plugin's control navigation and shop front
+page receivers, and of the plugin on the whole shop front page.
+
+Run with ``python -m pytest tests/benchmarks/bench_signals.py -s``.
+"""
+import pytest
+from django.core.cache import cache
+from django.test import RequestFactory
+from django.urls import resolve, reverse
+from pretix.multidomain.urlreverse import eventreverse
+
+from pretix_ticket_request.signals import navbar_info, pretixpresale_front_page_bottom
+
+
+@pytest.fixture
+def live_event(event):
+    event.live = True
+    event.save()
+    return event
+
+
+@pytest.mark.django_db
+def test_navbar_info(bench, event, locmem_cache):
+    path = reverse('plugins:pretix_ticket_request:list', kwargs={'organizer': event.organizer.slug, 'event': event.slug})
+    request = RequestFactory().get(path)
+    request.event = event
+    request.resolver_match = resolve(path)
+
+    def cold():
+        cache.clear()
+        navbar_info(sender=event, request=request)
+
+    bench('nav receiver, cold cache', cold, number=1000)
+    bench('nav receiver, cached URLs', lambda: navbar_info(sender=event, request=request), number=1000)
+
+
+@pytest.mark.django_db
+def test_front_page_bottom(bench, event, locmem_cache):
+    def cold():
+        cache.clear()
+        pretixpresale_front_page_bottom(sender=event)
+
+    bench('front page receiver, cold cache', cold, number=1000)
+    bench('front page receiver, cached fragment', lambda: pretixpresale_front_page_bottom(sender=event), number=1000)
+
+
+@pytest.mark.django_db
+def test_front_page(bench, client, live_event, locmem_cache):
+    url = eventreverse(live_event, 'presale:event.index')
+
+    assert client.get(url).status_code == 200
+    bench('GET shop front page with the plugin', lambda: client.get(url), number=50)
+
+    live_event.plugins = ''
+    live_event.save()
+    assert client.get(url).status_code == 200
+    bench('GET shop front page without the plugin', lambda: client.get(url), number=50)
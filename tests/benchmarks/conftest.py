@@ -0,0 +1,27 @@
+import timeit
+
+import pytest
+
+
+@pytest.fixture
+def locmem_cache(settings):
+    settings.CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': 100000},
+        },
+    }
+
+
+@pytest.fixture
+def bench():
+    """
+    Time ``func`` and print the best average of five rounds of ``number``
+    calls. Run the benchmarks with ``-s`` to see the results.
+    """
+    def run(label, func, number=100):
+        func()
+        seconds = min(timeit.repeat(func, number=number, repeat=5)) / number
+        print('{:<52} {:10.3f} ms'.format(label, seconds * 1000))
+        return seconds
+    return run
@@ -0,0 +1,26 @@
+import pytest
+from django.utils.timezone import now
+from django_scopes import scopes_disabled
+from pretix.base.models import Event, Organizer
+
+
+@pytest.fixture(autouse=True)
+def disable_scopes():
+    with scopes_disabled():
+        yield
+
+
+@pytest.fixture
+def organizer():
+    return Organizer.objects.create(name='Internet Freedom Festival', slug='iff')
+
+
+@pytest.fixture
+def event(organizer):
+    return Event.objects.create(
+        organizer=organizer,
+        name='IFF 2020',
+        slug='2020',
+        date_from=now(),
+        plugins='pretix_ticket_request',
+    )
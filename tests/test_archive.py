@@ -0,0 +1,130 @@
+import json
+from datetime import timedelta
+
+import pytest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.timezone import now
+from pretix.base.models import Voucher
+
+from pretix_ticket_request.archive import ATTENDEE_FIELDS, TICKET_REQUEST_FIELDS, EventArchiver
+from pretix_ticket_request.caching import redeemed_count
+from pretix_ticket_request.models import ArchiveChunk, Attendee, FreeTextAnswer, TicketRequest, delete_rows
+
+
+@pytest.fixture
+def rows(event):
+    voucher = Voucher.objects.create(event=event, code='IFF2020APPROVED')
+    requests = [
+        TicketRequest.objects.create(
+            event=event, name='Applicant {}'.format(n), email='applicant{}@example.org'.format(n),
+            status=TicketRequest.STATUS_APPROVED if n == 0 else TicketRequest.STATUS_PENDING,
+            voucher=voucher if n == 0 else None, data={'country': 'DE', 'n': n},
+        )
+        for n in range(3)
+    ]
+    attendees = [
+        Attendee.objects.create(event=event, email='attendee{}@example.org'.format(n), verified=True, profile={'n': n})
+        for n in range(2)
+    ]
+    FreeTextAnswer.objects.create(ticket_request=requests[1], field='pgp_key', value='key block')
+    return requests, attendees
+
+
+def _snapshot(model, fields):
+    return list(model.objects.order_by('pk').values(*fields))
+
+
+def _restored(kind):
+    records = []
+    for chunk in ArchiveChunk.objects.filter(kind=kind).order_by('first_id'):
+        records += chunk.records()
+    return records
+
+
+def _comparable(record):
+    # Records go through the same JSON encoding as the chunks.
+    return json.loads(json.dumps(record, cls=DjangoJSONEncoder))
+
+
+@pytest.mark.django_db
+def test_archive_and_restore(event, rows):
+    requests = [_comparable(r) for r in _snapshot(TicketRequest, TICKET_REQUEST_FIELDS)]
+    attendees = [_comparable(r) for r in _snapshot(Attendee, ATTENDEE_FIELDS)]
+
+    assert EventArchiver(event=event).run() == (3, 2)
+
+    assert not TicketRequest.objects.filter(event=event).exists()
+    assert not Attendee.objects.filter(event=event).exists()
+    assert not FreeTextAnswer.objects.exists()
+
+    restored = _restored(ArchiveChunk.KIND_TICKET_REQUEST)
+    assert [r['free_text'] for r in restored] == [{}, {'pgp_key': 'key block'}, {}]
+    assert [{k: v for k, v in r.items() if k != 'free_text'} for r in restored] == requests
+    assert restored[0]['voucher__code'] == 'IFF2020APPROVED'
+    assert [
+        {k: v for k, v in r.items() if k != 'free_text'} for r in _restored(ArchiveChunk.KIND_ATTENDEE)
+    ] == attendees
+
+
+@pytest.mark.django_db
+def test_archive_resumes_after_interruption(event, rows, monkeypatch):
+    monkeypatch.setattr(EventArchiver, 'CHUNK_SIZE', 2)
+    pack = ArchiveChunk.pack
+    calls = []
+
+    def failing_pack(event, kind, records):
+        calls.append(kind)
+        if len(calls) == 2:
+            raise RuntimeError('worker lost')
+        return pack(event, kind, records)
+
+    monkeypatch.setattr(ArchiveChunk, 'pack', failing_pack)
+    with pytest.raises(RuntimeError):
+        EventArchiver(event=event).run()
+
+    # The first chunk was committed together with the deletion of its rows,
+    # the failed one left its rows in place.
+    assert ArchiveChunk.objects.count() == 1
+    assert TicketRequest.objects.filter(event=event).count() == 1
+
+    monkeypatch.setattr(ArchiveChunk, 'pack', pack)
+    assert EventArchiver(event=event).run() == (1, 2)
+
+    restored = _restored(ArchiveChunk.KIND_TICKET_REQUEST)
+    assert [r['id'] for r in restored] == sorted(tr.pk for tr in rows[0])
+    assert len(_restored(ArchiveChunk.KIND_ATTENDEE)) == 2
+
+
+@pytest.mark.django_db
+def test_archive_resets_redeemed_count(event, rows, settings):
+    settings.CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+    requests, __ = rows
+    TicketRequest.objects.filter(pk=requests[0].pk).update(redeemed_at=now())
+    assert redeemed_count(event) == 1
+
+    EventArchiver(event=event).run()
+
+    assert redeemed_count(event) == 0
+
+
+@pytest.mark.django_db
+def test_is_due(event):
+    archiver = EventArchiver(event=event)
+    assert not archiver.is_due()
+
+    event.settings.ticket_request_archive_after_days = 30
+    event.date_from = now() - timedelta(days=31)
+    assert archiver.is_due()
+    event.date_from = now() - timedelta(days=29)
+    assert not archiver.is_due()
+
+
+@pytest.mark.django_db
+def test_delete_rows(event, rows):
+    requests, attendees = rows
+
+    assert delete_rows(Attendee, [attendees[0].pk]) == 1
+    assert delete_rows(Attendee, []) == 0
+
+    assert list(Attendee.objects.values_list('pk', flat=True)) == [attendees[1].pk]
+    assert TicketRequest.objects.count() == 3
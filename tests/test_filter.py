@@ -0,0 +1,32 @@
+import pytest
+
+from pretix_ticket_request.filter import _json_contains, filter_json_contains
+from pretix_ticket_request.models import Attendee
+
+
+@pytest.mark.parametrize('document,value,expected', [
+    ({'country': 'DE', 'gender': 'Female'}, {'country': 'DE'}, True),
+    ({'country': 'DE', 'gender': 'Female'}, {'country': 'DE', 'gender': 'Female'}, True),
+    ({'country': 'DE', 'gender': 'Female'}, {'country': 'DE', 'gender': 'Male'}, False),
+    ({'country': 'DE'}, {'gender': 'Female'}, False),
+    ({'country': 'DE'}, {}, True),
+    ({}, {'country': 'DE'}, False),
+    ({'summary': {'fingerprint': 'ABC', 'valid': True}}, {'summary': {'fingerprint': 'ABC'}}, True),
+    ({'summary': {'fingerprint': 'ABC'}}, {'summary': {'fingerprint': 'DEF'}}, False),
+    ({'summary': 'ABC'}, {'summary': {'fingerprint': 'ABC'}}, False),
+    ({'subscribe_mailing_list': 'True'}, {'subscribe_mailing_list': True}, False),
+])
+def test_json_contains(document, value, expected):
+    assert _json_contains(document, value) is expected
+
+
+@pytest.mark.django_db
+def test_filter_json_contains(event):
+    german = Attendee.objects.create(event=event, email='de@example.org', profile={'country': 'DE', 'gender': 'Female'})
+    Attendee.objects.create(event=event, email='us@example.org', profile={'country': 'US', 'gender': 'Female'})
+    Attendee.objects.create(event=event, email='none@example.org', profile={})
+
+    qs = filter_json_contains(Attendee.objects.all(), 'profile', {'country': 'DE', 'gender': 'Female'})
+
+    assert list(qs) == [german]
+    assert filter_json_contains(Attendee.objects.all(), 'profile', {'gender': 'Female'}).count() == 2
@@ -0,0 +1,30 @@
+import os
+import subprocess
+import sys
+
+# Loading the plugin must not pull in view and form modules, which import
+# large parts of pretix, into processes that never serve a request.
+SCRIPT = """
+import sys
+
+import django
+
+django.setup()
+
+import pretix_ticket_request  # NOQA
+import pretix_ticket_request.signals  # NOQA
+
+for name in ('pretix_ticket_request.views', 'pretix_ticket_request.forms', 'pretix.presale.views'):
+    if name in sys.modules:
+        print(name)
+"""
+
+
+def test_signals_do_not_import_views_or_forms():
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE='pretix.testutils.settings')
+    result = subprocess.run(
+        [sys.executable, '-c', SCRIPT], env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True,
+    )
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split() == []
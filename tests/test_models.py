@@ -0,0 +1,66 @@
+import pytest
+from django.utils.timezone import now
+from pretix.base.models import Event
+
+from pretix_ticket_request.models import FunnelBucket, TicketRequest, insert_rows
+
+
+def _today(event):
+    return now().astimezone(event.timezone).date()
+
+
+@pytest.mark.django_db
+def test_funnel_bump_creates_todays_bucket(event):
+    FunnelBucket.bump(event, 'requested')
+
+    bucket = FunnelBucket.objects.get(event=event)
+    assert bucket.date == _today(event)
+    assert (bucket.requested, bucket.approved, bucket.redeemed) == (1, 0, 0)
+
+
+@pytest.mark.django_db
+def test_funnel_bump_increments_existing_bucket(event):
+    FunnelBucket.bump(event, 'requested')
+    FunnelBucket.bump(event, 'requested', 2)
+    FunnelBucket.bump(event, 'approved')
+
+    bucket = FunnelBucket.objects.get(event=event)
+    assert (bucket.requested, bucket.approved) == (3, 1)
+
+
+@pytest.mark.django_db
+def test_funnel_bump_is_per_event(event, organizer):
+    other = Event.objects.create(
+        organizer=organizer, name='IFF 2021', slug='2021', date_from=now(), plugins='pretix_ticket_request',
+    )
+    FunnelBucket.bump(event, 'requested')
+    FunnelBucket.bump(other, 'requested', 5)
+
+    assert FunnelBucket.objects.get(event=event).requested == 1
+    assert FunnelBucket.objects.get(event=other).requested == 5
+
+
+@pytest.mark.django_db
+def test_funnel_revert_stops_at_zero(event):
+    FunnelBucket.bump(event, 'redeemed', 2)
+
+    FunnelBucket.revert(event, 'redeemed', _today(event))
+    assert FunnelBucket.objects.get(event=event).redeemed == 1
+
+    FunnelBucket.revert(event, 'redeemed', _today(event), 3)
+    assert FunnelBucket.objects.get(event=event).redeemed == 0
+
+
+@pytest.mark.django_db
+def test_insert_rows_skips_conflicting_rows(event):
+    existing = TicketRequest.objects.create(event=event, name='Ada', email='ada@example.org', data={})
+
+    ids = insert_rows(TicketRequest, [
+        TicketRequest(event=event, name='Someone else', email='ada@example.org', data={}),
+        TicketRequest(event=event, name='Grace', email='grace@example.org', data={}),
+    ], 'email')
+
+    grace = TicketRequest.objects.get(email='grace@example.org')
+    assert ids == {'grace@example.org': grace.pk}
+    assert TicketRequest.objects.get(email='ada@example.org') == existing
+    assert TicketRequest.objects.get(email='ada@example.org').name == 'Ada'
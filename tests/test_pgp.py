@@ -0,0 +1,81 @@
+import pytest
+
+from pretix_ticket_request.filter import TicketRequestSearchFilterForm
+from pretix_ticket_request.models import FreeTextAnswer, TicketRequest
+from pretix_ticket_request.pgp import pgp_key_fingerprint, summarize_pgp_key
+
+ED25519_KEY = '''\
+-----BEGIN PGP PUBLIC KEY BLOCK-----
+
+mDMEatX8rRYJKwYBBAHaRw8BAQdAHf4TPpEK6BPN3AMmpwD/i+su84jwhOr7cuQC
+gPdAsW60JlRlc3QgQXBwbGljYW50IDxhcHBsaWNhbnRAZXhhbXBsZS5vcmc+iJAE
+ExYIADgWIQQgWnnH4NtDYxLqiKI4n2h+BpJV9QUCatX8rQIbAwULCQgHAgYVCgkI
+CwIEFgIDAQIeAQIXgAAKCRA4n2h+BpJV9Q8KAP4lwH1siMMouuIcQ7n8i/xEWAh/
+P80cKJBvJA8gUM9hyQEA/tnzaylaKdTQ+Z1zpI/cqlRCjpoGf+KUIje36ENNjAg=
+=dwzt
+-----END PGP PUBLIC KEY BLOCK-----
+'''
+
+RSA_KEY = '''\
+-----BEGIN PGP PUBLIC KEY BLOCK-----
+
+mI0EatX8rQEEAMOZ6EIQniDIzLatU/qNPjVq5N0F/2zTF+/6DhuCJb4rhFiDcZMN
+rd/CkCZvKuO87ZdKHam6QTjuwBnozcc/E5hYXSWq6Zwz+O2nNeh+LPSBKSMMVCqc
+8b1X1CAj4ZJ1d9zC7iM9PbWzalVnrkv4tHXeX1Uqi71n6C+0XLTGrJixABEBAAG0
+H1JTQSBBcHBsaWNhbnQgPHJzYUBleGFtcGxlLm9yZz6IzgQTAQoAOBYhBOF6l32x
+BqYF/MK/PlVDakmq9OfdBQJq1fytAhsDBQsJCAcCBhUKCQgLAgQWAgMBAh4BAheA
+AAoJEFVDakmq9OfdP2ID/23yEpO2mKgL/1MrwtkypwXj//mWm5B1jQDrKWoPEMMm
+CNQecAAx80Ip1pImH4yyPlBrnkERo8QOICnceIpJFtLhpiV1BcOL4FL620/B47kB
+hgNvcb498V7pOY+HMmvUk7Km4JwNDBJDCHeKJo8aAjoYnqB8RZpzTOA5OIGoghKe
+=ZTkt
+-----END PGP PUBLIC KEY BLOCK-----
+'''
+
+
+def test_summarize_ed25519_key():
+    assert summarize_pgp_key(ED25519_KEY) == {
+        'valid': True,
+        'fingerprint': '205A79C7E0DB436312EA88A2389F687E069255F5',
+        'algorithm': 'EdDSA',
+        'bits': 256,
+        'created': '2026-10-19',
+    }
+
+
+def test_summarize_rsa_key():
+    assert summarize_pgp_key(RSA_KEY) == {
+        'valid': True,
+        'fingerprint': 'E17A977DB106A605FCC2BF3E55436A49AAF4E7DD',
+        'algorithm': 'RSA',
+        'bits': 1024,
+        'created': '2026-10-19',
+    }
+
+
+def test_summarize_key_with_surrounding_text_and_headers():
+    text = 'My key:\n\n' + RSA_KEY.replace('\n\n', '\nComment: pasted from a mail\n\n', 1) + '\nThanks!'
+    assert summarize_pgp_key(text)['fingerprint'] == 'E17A977DB106A605FCC2BF3E55436A49AAF4E7DD'
+
+
+@pytest.mark.parametrize('text,error', [
+    ('ssh-ed25519 AAAAC3NzaC1lZDI1NTE5AAAAIPl applicant@example.org', 'Not an ASCII-armored public key block'),
+    ('-----BEGIN PGP PUBLIC KEY BLOCK-----\n\n!!!\n-----END PGP PUBLIC KEY BLOCK-----', 'Invalid armor encoding'),
+    (ED25519_KEY.replace('mDMEatX8', 'tDMEatX8'), 'The block does not start with a public key'),
+])
+def test_summarize_invalid_blocks(text, error):
+    assert summarize_pgp_key(text) == {'valid': False, 'error': error}
+
+
+def test_fingerprint_of_invalid_block_is_empty():
+    assert pgp_key_fingerprint('not a key') == ''
+
+
+@pytest.mark.django_db
+def test_search_by_fingerprint(event):
+    tr = TicketRequest.objects.create(event=event, name='Applicant', email='applicant@example.org', data={})
+    TicketRequest.objects.create(event=event, name='Other', email='other@example.org', data={})
+    FreeTextAnswer.objects.create(ticket_request=tr, field='pgp_key', value=ED25519_KEY)
+
+    form = TicketRequestSearchFilterForm(data={'query': '205a 79c7 e0db 4363 12ea  88a2 389f 687e 0692 55f5'}, request=None)
+    assert form.is_valid()
+    assert list(form.filter_qs(TicketRequest.objects.all())) == [tr]
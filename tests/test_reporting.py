@@ -0,0 +1,78 @@
+import pytest
+from django.db import connection
+
+from pretix_ticket_request import reporting
+from pretix_ticket_request.models import Attendee, TicketRequest
+from pretix_ticket_request.reporting import compute_report
+
+
+@pytest.mark.django_db
+def test_compute_report(event):
+    TicketRequest.objects.create(event=event, name='A', email='a@example.org', status=TicketRequest.STATUS_APPROVED, data={
+        'country': 'DE',
+        'gender': 'Female',
+        'years_attended_iff': ['Not yet!'],
+        'professional_areas': ['Advocacy', 'Design'],
+        'is_refugee': 'True',
+    })
+    TicketRequest.objects.create(event=event, name='B', email='b@example.org', status=TicketRequest.STATUS_PENDING, data={
+        'country': 'DE',
+        'gender': 'Female',
+        'years_attended_iff': ['2019'],
+        'professional_areas': ['Advocacy'],
+        'is_refugee': 'False',
+    })
+    Attendee.objects.create(event=event, email='a@example.org', verified=True, profile={
+        'country': 'DE',
+        'gender': 'Female',
+        'years_attended_iff': ['Not yet!'],
+        'professional_areas': ['Design'],
+        'is_refugee': 'True',
+    })
+    Attendee.objects.create(event=event, email='c@example.org', verified=False, profile={'country': 'US'})
+
+    report = compute_report(event)
+
+    # Rows are the dimension values followed by the requested, approved and
+    # attended counts.
+    assert report['country_gender_first_time'] == [
+        ('DE', 'Female', 'False', 1, 0, 0),
+        ('DE', 'Female', 'True', 1, 1, 1),
+    ]
+    assert report['professional_area_minority_group'] == [
+        ('Advocacy', 'False', 1, 0, 0),
+        ('Advocacy', 'True', 1, 1, 0),
+        ('Design', 'True', 1, 1, 1),
+    ]
+
+
+@pytest.mark.django_db
+def test_compute_report_counts_missing_answers_as_blank(event):
+    TicketRequest.objects.create(event=event, name='A', email='a@example.org', data={})
+
+    report = compute_report(event)
+
+    assert report['country_gender_first_time'] == [('', '', 'True', 1, 0, 0)]
+    assert report['professional_area_minority_group'] == [('', '', 1, 0, 0)]
+
+
+@pytest.mark.django_db
+@pytest.mark.skipif(connection.vendor != 'postgresql', reason='the cross-tabs are only counted in SQL on PostgreSQL')
+def test_database_counts_match_python_counts(event):
+    documents = [
+        {'country': 'DE', 'gender': 'Female', 'years_attended_iff': ['Not yet!'], 'professional_areas': ['Advocacy', 'Design'],
+         'is_refugee': 'True'},
+        {'country': 'DE', 'gender': 'Female', 'years_attended_iff': ['2019', '2018'], 'professional_areas': 'Design',
+         'is_refugee': True},
+        {'country': '', 'years_attended_iff': [], 'professional_areas': [], 'is_refugee': False},
+        {'gender': None, 'years_attended_iff': '2019', 'professional_areas': None},
+        {},
+    ]
+    for i, data in enumerate(documents):
+        TicketRequest.objects.create(
+            event=event, name=str(i), email='{}@example.org'.format(i), data=data,
+            status=TicketRequest.STATUS_APPROVED if i % 2 else TicketRequest.STATUS_PENDING,
+        )
+        Attendee.objects.create(event=event, email='{}@example.org'.format(i), verified=bool(i % 2), profile=data)
+
+    assert reporting._count_in_database(event, 'default') == reporting._count_in_python(event, 'default')
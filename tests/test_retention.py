@@ -0,0 +1,112 @@
+import json
+
+import pytest
+from django.contrib.contenttypes.models import ContentType
+from pretix.base.models import LogEntry, Voucher
+
+from pretix_ticket_request.archive import EventArchiver
+from pretix_ticket_request.models import ArchiveChunk, Attendee, FreeTextAnswer, TicketRequest
+from pretix_ticket_request.retention import MODE_ANONYMIZE, MODE_DELETE, RetentionEngine
+
+
+@pytest.fixture
+def applicants(event):
+    voucher = Voucher.objects.create(event=event, code='IFF2020APPROVED', comment='Created for a@example.org')
+    approved = TicketRequest.objects.create(
+        event=event, name='Approved Applicant', email='a@example.org', status=TicketRequest.STATUS_APPROVED,
+        voucher=voucher, data={'country': 'DE', 'organization': 'NGO'},
+    )
+    pending = TicketRequest.objects.create(
+        event=event, name='Pending Applicant', email='p@example.org', data={'country': 'US'},
+    )
+    attendee = Attendee.objects.create(event=event, email='a@example.org', verified=True, profile={'country': 'DE'})
+    FreeTextAnswer.objects.create(ticket_request=pending, field='pgp_key', value='not a key')
+    for obj in (approved, pending, attendee):
+        obj.log_action('pretix.ticket_request.changed', data={'email': obj.email})
+    voucher.log_action('pretix.voucher.approved.ticket_request', data={'email': approved.email, 'max_usages': 1})
+    return approved, pending, attendee, voucher
+
+
+def _log_data(model, pk, action='pretix.ticket_request.changed'):
+    entry = LogEntry.objects.get(
+        content_type=ContentType.objects.get_for_model(model), object_id=pk, action_type=action,
+    )
+    return json.loads(entry.data)
+
+
+def _engine(event, mode):
+    event.settings.ticket_request_retention_mode = mode
+    return RetentionEngine(event=event)
+
+
+@pytest.mark.django_db
+def test_anonymize(event, applicants):
+    approved, pending, attendee, voucher = applicants
+
+    counts = _engine(event, MODE_ANONYMIZE).run()
+
+    assert counts == {'ticket_request': 2, 'attendee': 1, 'archive': 0}
+    for tr in TicketRequest.objects.all():
+        assert tr.name == ''
+        assert tr.email == 'anonymized-{}@invalid'.format(tr.pk)
+        assert tr.data == {}
+        assert tr.anonymized_at
+    attendee.refresh_from_db()
+    assert attendee.email == 'anonymized-{}@invalid'.format(attendee.pk)
+    assert attendee.profile == {}
+    assert not FreeTextAnswer.objects.exists()
+    assert _log_data(TicketRequest, pending.pk) == {}
+    assert _log_data(Attendee, attendee.pk) == {}
+    voucher.refresh_from_db()
+    assert voucher.comment == ''
+    assert _log_data(Voucher, voucher.pk, 'pretix.voucher.approved.ticket_request') == {'max_usages': 1}
+
+
+@pytest.mark.django_db
+def test_delete_keeps_requests_with_vouchers(event, applicants):
+    approved, pending, attendee, voucher = applicants
+
+    _engine(event, MODE_DELETE).run()
+
+    assert list(TicketRequest.objects.values_list('pk', flat=True)) == [approved.pk]
+    approved.refresh_from_db()
+    assert approved.email == 'anonymized-{}@invalid'.format(approved.pk)
+    assert not Attendee.objects.exists()
+    assert not FreeTextAnswer.objects.exists()
+    assert _log_data(TicketRequest, pending.pk) == {}
+    assert Voucher.objects.filter(pk=voucher.pk).exists()
+
+
+@pytest.mark.django_db
+def test_resumes_from_checkpoint(event, applicants, monkeypatch):
+    monkeypatch.setattr(RetentionEngine, 'CHUNK_SIZE', 1)
+
+    assert _engine(event, MODE_ANONYMIZE).run(max_batches=1) == {'ticket_request': 1, 'attendee': 0, 'archive': 0}
+    assert TicketRequest.objects.filter(anonymized_at__isnull=True).count() == 1
+    assert event.settings.ticket_request_retention_checkpoint == {'ticket_request': applicants[0].pk}
+
+    # A new engine, as in the next periodic run, continues after the checkpoint.
+    assert _engine(event, MODE_ANONYMIZE).run() == {'ticket_request': 1, 'attendee': 1, 'archive': 0}
+    assert not TicketRequest.objects.filter(anonymized_at__isnull=True).exists()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('mode', [MODE_ANONYMIZE, MODE_DELETE])
+def test_archived_rows(event, applicants, mode):
+    approved, pending, attendee, voucher = applicants
+    EventArchiver(event=event).run()
+
+    counts = _engine(event, mode).run()
+
+    assert counts == {'ticket_request': 0, 'attendee': 0, 'archive': 2}
+    assert _log_data(TicketRequest, approved.pk) == {}
+    assert _log_data(TicketRequest, pending.pk) == {}
+    assert _log_data(Attendee, attendee.pk) == {}
+    voucher.refresh_from_db()
+    assert voucher.comment == ''
+    if mode == MODE_DELETE:
+        assert not ArchiveChunk.objects.exists()
+    for chunk in ArchiveChunk.objects.all():
+        assert chunk.anonymized_at
+        for record in chunk.records():
+            assert not {'name', 'email', 'data', 'profile', 'free_text'} & set(record)
@@ -0,0 +1,86 @@
+import configparser
+
+import pytest
+from django.test import RequestFactory
+
+from pretix_ticket_request import reporting, routing
+from pretix_ticket_request.reporting import get_report, invalidate_report
+from pretix_ticket_request.routing import (
+    LAST_WRITE_SESSION_KEY, mark_written, read_database, replica_database,
+)
+
+
+@pytest.fixture
+def locmem_cache(settings):
+    settings.CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@pytest.fixture
+def replica(settings):
+    config = configparser.RawConfigParser()
+    config.read_dict({'ticket_request': {'replica': 'on', 'replica_staleness': '10'}})
+    settings.CONFIG_FILE = config
+    settings.DATABASE_REPLICA = 'replica'
+
+
+@pytest.fixture
+def request_with_session():
+    request = RequestFactory().get('/')
+    request.session = {}
+    return request
+
+
+def test_replica_is_off_by_default(settings, request_with_session):
+    settings.CONFIG_FILE = configparser.RawConfigParser()
+
+    assert replica_database() == 'default'
+    assert read_database(request_with_session) == 'default'
+
+
+def test_reads_use_replica_when_enabled(replica, request_with_session):
+    assert replica_database() == 'replica'
+    assert read_database() == 'replica'
+    assert read_database(request_with_session) == 'replica'
+
+
+def test_mark_written_pins_reads_to_primary_for_a_while(replica, request_with_session, monkeypatch):
+    monkeypatch.setattr(routing.time, 'time', lambda: 1000)
+    mark_written(request_with_session)
+
+    assert request_with_session.session[LAST_WRITE_SESSION_KEY] == 1000
+    assert read_database(request_with_session) == 'default'
+    # Reads without a request are not pinned.
+    assert read_database() == 'replica'
+
+    monkeypatch.setattr(routing.time, 'time', lambda: 1011)
+    assert read_database(request_with_session) == 'replica'
+
+
+def test_mark_written_does_nothing_without_replica(settings, request_with_session):
+    settings.CONFIG_FILE = configparser.RawConfigParser()
+
+    mark_written(request_with_session)
+
+    assert request_with_session.session == {}
+
+
+@pytest.mark.django_db
+def test_replica_report_does_not_replace_primary_report(event, locmem_cache, monkeypatch):
+    monkeypatch.setattr(reporting, 'compute_report', lambda event, using='default': {'using': using})
+
+    assert get_report(event, using='replica') == {'using': 'replica'}
+    assert get_report(event) == {'using': 'default'}
+    # A report computed on the primary is preferred once it is cached.
+    assert get_report(event, using='replica') == {'using': 'default'}
+
+
+@pytest.mark.django_db
+def test_invalidate_report_clears_replica_report(event, locmem_cache, monkeypatch):
+    monkeypatch.setattr(reporting, 'replica_database', lambda: 'replica')
+    monkeypatch.setattr(reporting, 'compute_report', lambda event, using='default': {'using': using})
+    get_report(event, using='replica')
+
+    invalidate_report(event)
+    monkeypatch.setattr(reporting, 'compute_report', lambda event, using='default': {'using': using, 'fresh': True})
+
+    assert get_report(event, using='replica') == {'using': 'replica', 'fresh': True}
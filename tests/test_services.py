@@ -0,0 +1,158 @@
+import pytest
+from django.core.cache import cache
+from django.db import transaction
+from pretix.base.models import Quota
+
+from pretix_ticket_request.services import QuotaSnapshot
+
+
+@pytest.fixture
+def locmem_cache(settings):
+    settings.CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@pytest.fixture
+def quota(event):
+    return Quota.objects.create(event=event, name='Ticket requests', size=3)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_snapshot_is_seeded_from_quota_availability(event, quota, locmem_cache):
+    snapshot = QuotaSnapshot(event=event, quota=quota)
+
+    assert snapshot.remaining == 3
+    assert cache.get(QuotaSnapshot.CACHE_KEY.format(quota.pk)) == 3
+
+
+@pytest.mark.django_db(transaction=True)
+def test_snapshot_reuses_shared_counter(event, quota, locmem_cache, monkeypatch):
+    QuotaSnapshot(event=event, quota=quota)
+
+    def fail(*args, **kwargs):
+        raise AssertionError('availability computed again')
+
+    monkeypatch.setattr(Quota, 'availability', fail)
+    assert QuotaSnapshot(event=event, quota=quota).remaining == 3
+
+
+@pytest.mark.django_db(transaction=True)
+def test_snapshot_is_not_computed_until_needed(event, quota, locmem_cache, monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError('availability computed')
+
+    monkeypatch.setattr(Quota, 'availability', fail)
+    QuotaSnapshot(event=event, quota=quota)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_reserve_takes_from_shared_counter_without_recomputing(event, quota, locmem_cache, monkeypatch):
+    QuotaSnapshot(event=event, quota=quota).remaining
+
+    def fail(*args, **kwargs):
+        raise AssertionError('availability computed again')
+
+    monkeypatch.setattr(Quota, 'availability', fail)
+    snapshot = QuotaSnapshot(event=event, quota=quota)
+    with transaction.atomic():
+        assert snapshot.reserve(2)
+        assert cache.get(QuotaSnapshot.CACHE_KEY.format(quota.pk)) == 1
+        assert cache.get(QuotaSnapshot.PENDING_KEY.format(quota.pk)) == 2
+
+    assert snapshot.remaining == 1
+    assert cache.get(QuotaSnapshot.PENDING_KEY.format(quota.pk)) == 0
+
+
+@pytest.mark.django_db(transaction=True)
+def test_reserve_counts_uncommitted_reservations_when_recomputing(event, quota, locmem_cache):
+    with transaction.atomic():
+        snapshot = QuotaSnapshot(event=event, quota=quota)
+        assert snapshot.reserve(3)
+        # Dropping the counter forces a recomputation, which must not hand
+        # out the places reserved above again.
+        cache.delete(QuotaSnapshot.CACHE_KEY.format(quota.pk))
+        assert not QuotaSnapshot(event=event, quota=quota).reserve()
+
+    assert cache.get(QuotaSnapshot.PENDING_KEY.format(quota.pk)) == 0
+
+
+@pytest.mark.django_db(transaction=True)
+def test_reserve_recomputes_exhausted_counter(event, quota, locmem_cache):
+    cache.set(QuotaSnapshot.CACHE_KEY.format(quota.pk), 0)
+
+    snapshot = QuotaSnapshot(event=event, quota=quota)
+    with transaction.atomic():
+        assert snapshot.reserve()
+
+    assert cache.get(QuotaSnapshot.CACHE_KEY.format(quota.pk)) == 2
+
+
+@pytest.mark.django_db(transaction=True)
+def test_reserve_fails_when_quota_is_full(event, quota, locmem_cache):
+    snapshot = QuotaSnapshot(event=event, quota=quota)
+    with transaction.atomic():
+        assert snapshot.reserve(3)
+        assert not snapshot.reserve()
+
+    assert snapshot.reserved == 3
+    assert cache.get(QuotaSnapshot.CACHE_KEY.format(quota.pk)) == 0
+
+
+@pytest.mark.django_db(transaction=True)
+def test_release_gives_back_reserved_places(event, quota, locmem_cache):
+    snapshot = QuotaSnapshot(event=event, quota=quota)
+
+    with pytest.raises(RuntimeError):
+        with transaction.atomic():
+            assert snapshot.reserve(2)
+            try:
+                raise RuntimeError()
+            except RuntimeError:
+                snapshot.release()
+                raise
+
+    assert snapshot.reserved == 0
+    assert cache.get(QuotaSnapshot.CACHE_KEY.format(quota.pk)) == 3
+    assert cache.get(QuotaSnapshot.PENDING_KEY.format(quota.pk)) == 0
+
+
+@pytest.mark.django_db(transaction=True)
+def test_reserve_without_shared_cache_recomputes_once(event, quota, monkeypatch, settings):
+    settings.CACHES = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+    calls = []
+    availability = Quota.availability
+
+    def counting(self, *args, **kwargs):
+        calls.append(self.pk)
+        return availability(self, *args, **kwargs)
+
+    monkeypatch.setattr(Quota, 'availability', counting)
+    snapshot = QuotaSnapshot(event=event, quota=quota)
+    with transaction.atomic():
+        assert snapshot.reserve()
+        assert snapshot.reserve(2)
+        assert not snapshot.reserve()
+
+    assert calls == [quota.pk]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_revalidate_replaces_stale_counter(event, quota, locmem_cache):
+    snapshot = QuotaSnapshot(event=event, quota=quota)
+    cache.set(QuotaSnapshot.CACHE_KEY.format(quota.pk), 0)
+
+    with transaction.atomic():
+        snapshot.revalidate()
+
+    assert snapshot.remaining == 3
+    assert cache.get(QuotaSnapshot.CACHE_KEY.format(quota.pk)) == 3
+
+
+@pytest.mark.django_db(transaction=True)
+def test_unlimited_quota(event, locmem_cache):
+    quota = Quota.objects.create(event=event, name='Unlimited', size=None)
+    snapshot = QuotaSnapshot(event=event, quota=quota)
+
+    assert snapshot.unlimited
+    with transaction.atomic():
+        assert snapshot.reserve(1000)
+    assert snapshot.remaining == -1
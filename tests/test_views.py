@@ -0,0 +1,33 @@
+import pytest
+from pretix.multidomain.urlreverse import eventreverse
+
+
+@pytest.fixture
+def live_event(event):
+    event.live = True
+    event.save()
+    return event
+
+
+@pytest.mark.django_db
+def test_request_page_without_cookies_is_public(client, live_event):
+    response = client.get(eventreverse(live_event, 'plugins:pretix_ticket_request:request'))
+
+    assert response.status_code == 200
+    assert 'public' in response['Cache-Control']
+    assert 'Cookie' in response['Vary']
+    assert b'data-ticket-request-csrf' in response.content
+    assert not response.cookies
+
+
+@pytest.mark.django_db
+def test_request_page_with_cookies_is_private_and_has_token(client, live_event):
+    client.cookies['pretix_language'] = 'en'
+
+    response = client.get(eventreverse(live_event, 'plugins:pretix_ticket_request:request'))
+
+    assert response.status_code == 200
+    assert 'private' in response['Cache-Control']
+    assert b'data-ticket-request-csrf' not in response.content
+    assert b'name="csrfmiddlewaretoken" value=""' not in response.content
+    assert b'name="csrfmiddlewaretoken"' in response.content